@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+"""Sensor reads that survive I2C bus errors
+
+A read that fails with a bus error (an OSError of BUS_ERRNOS, as the
+I2C transfers of smbus2 raise, or a TimeoutError of a driver) is retried
+after a delay that doubles from BACKOFF_MIN up to BACKOFF_MAX, so a
+broken bus is not polled in a busy loop. Other errors, e.g. of a file
+written by the driver, are raised at once. After REINIT_FAILURES failures in a row the sensor is re-initialized
+with its reinit() (bus re-open and driver setup), and again after each
+further REINIT_FAILURES failures.
+
+    runner = AcquisitionRunner()
+    runner.add("bme280", BME280())
+    p, t, h = runner.read("bme280")
+    print(runner.stats())
+"""
+
+import errno
+from time import monotonic, sleep
+
+BACKOFF_MIN = 0.1  # sec
+BACKOFF_MAX = 60.0  # sec
+REINIT_FAILURES = 3
+# errno of failed transfers of Linux i2c-dev, not all are defined elsewhere
+BUS_ERRNOS = frozenset(
+    getattr(errno, name)
+    for name in ("EIO", "EREMOTEIO", "ENXIO", "ENODEV", "ETIMEDOUT", "EAGAIN", "EBUSY")
+    if hasattr(errno, name)
+)
+
+
+def is_bus_error(e):
+    """Return True if the OSError e is from the bus, not e.g. from a file"""
+    return isinstance(e, TimeoutError) or e.errno in BUS_ERRNOS
+
+
+class DeviceStats:
+    """Error and latency counters of one sensor"""
+
+    def __init__(self):
+        self.reads = 0
+        self.errors = 0
+        self.reinits = 0
+        self.reinit_errors = 0
+        self.consecutive_errors = 0
+        self.last_error = None
+        self.latency_last = 0.0  # sec, of successful calls
+        self.latency_max = 0.0
+        self.latency_total = 0.0
+
+    def as_dict(self):
+        latency_mean = self.latency_total / self.reads if self.reads else 0.0
+        return dict(
+            reads=self.reads,
+            errors=self.errors,
+            reinits=self.reinits,
+            reinit_errors=self.reinit_errors,
+            consecutive_errors=self.consecutive_errors,
+            last_error=self.last_error,
+            latency_last=self.latency_last,
+            latency_mean=latency_mean,
+            latency_max=self.latency_max,
+        )
+
+
+class AcquisitionRunner:
+    """Call sensor methods with backoff, re-initialization and counters
+
+    param:
+        backoff_min (float): first retry delay (sec)
+        backoff_max (float): longest retry delay (sec)
+        reinit_failures (int): failures in a row before reinit()
+        attempts (int): raise the bus error after this many failures in a
+            row, None retries forever
+    """
+
+    def __init__(
+        self,
+        backoff_min=BACKOFF_MIN,
+        backoff_max=BACKOFF_MAX,
+        reinit_failures=REINIT_FAILURES,
+        attempts=None,
+    ):
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.reinit_failures = reinit_failures
+        self.attempts = attempts
+        self.sensors = {}
+        self._stats = {}
+
+    def add(self, name, sensor):
+        """Add a sensor with get() and reinit() methods"""
+        self.sensors[name] = sensor
+        self._stats[name] = DeviceStats()
+
+    def read(self, name):
+        """Return sensor.get() of the sensor added as name"""
+        return self.call(name, self.sensors[name].get)
+
+    def call(self, name, func, *args):
+        """Return func(*args), retrying while it raises a bus error
+        param:
+            name (str): sensor whose bus func accesses
+            func (callable): e.g. a method of the sensor
+        """
+        stats = self._stats[name]
+        backoff = self.backoff_min
+        while True:
+            start = monotonic()
+            try:
+                result = func(*args)
+            except OSError as e:
+                if not is_bus_error(e):
+                    raise
+                stats.errors += 1
+                stats.consecutive_errors += 1
+                stats.last_error = repr(e)
+                attempts = self.attempts
+                if attempts is not None and stats.consecutive_errors >= attempts:
+                    raise
+            else:
+                latency = monotonic() - start
+                stats.reads += 1
+                stats.consecutive_errors = 0
+                stats.latency_last = latency
+                stats.latency_max = max(stats.latency_max, latency)
+                stats.latency_total += latency
+                return result
+
+            sleep(backoff)
+            backoff = min(backoff * 2, self.backoff_max)
+            if stats.consecutive_errors % self.reinit_failures == 0:
+                self._reinit(name)
+
+    def _reinit(self, name):
+        stats = self._stats[name]
+        stats.reinits += 1
+        try:
+            self.sensors[name].reinit()
+        except OSError as e:
+            # The bus is still broken, the next call retries.
+            stats.reinit_errors += 1
+            stats.last_error = repr(e)
+
+    def stats(self, name=None):
+        """Return the counters of a sensor as dict, of all sensors by name"""
+        if name is not None:
+            return self._stats[name].as_dict()
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
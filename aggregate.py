@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""Streaming statistics of sensor readings over a logging interval
+
+Readings are taken at a high rate and only their statistics are kept,
+in O(1) memory per field (Welford's algorithm for the variance).
+"""
+
+import math
+
+
+class RunningStats:
+    """Count, mean, min, max and standard deviation of a stream of values"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._m2 = 0.0  # sum of squared differences from the mean
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def stddev(self):
+        """Sample standard deviation, 0.0 for less than two values"""
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self._m2 / (self.count - 1))
+
+
+class Aggregator:
+    """RunningStats of each field
+
+    param:
+        fields (list of str): column names of the plain log (dump_data.csv)
+    """
+
+    STATS = ("min", "max", "std", "count")
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.stats = {field: RunningStats() for field in self.fields}
+
+    def add(self, field, value):
+        self.stats[field].add(value)
+
+    def has_data(self):
+        """Return True if any field has a value"""
+        return any(s.count != 0 for s in self.stats.values())
+
+    def reset(self):
+        for s in self.stats.values():
+            s.reset()
+
+    def header(self):
+        """Return the CSV header of row()
+        The mean keeps the column name of the field, the others are
+        suffixed, e.g. "CO2 ppm, CO2 ppm min, CO2 ppm max, ...".
+        """
+        columns = ["Date"]
+        for field in self.fields:
+            columns += [field] + [f"{field} {stat}" for stat in self.STATS]
+        return ", ".join(columns) + "\n"
+
+    def row(self):
+        """Return mean, min, max, stddev and count of each field
+        The statistics of a field without values are empty strings.
+        """
+        values = []
+        for field in self.fields:
+            s = self.stats[field]
+            if s.count == 0:
+                values += ["", "", "", "", 0]
+            else:
+                values += [s.mean, s.min, s.max, s.stddev, s.count]
+        return values
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+"""Benchmark the decimation of long sensor series (decimate.py)
+
+A synthetic CO2 series of several million rows with short spikes is
+reduced to a few thousand points by striding (the old thin_out_data),
+LTTB and per-bucket min/max. The time and the number of kept spikes
+are printed for each.
+
+usage: python3 bench_decimate.py [rows]
+"""
+
+import sys
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from decimate import LTTB, MINMAX, decimate_frame
+
+POINTS = 4000
+SPIKES = 50
+
+
+def make_frame(rows, seed=0):
+    """Return CO2 and temperature sampled every second, with CO2 spikes"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(rows)
+    day = 24 * 60 * 60
+    co2 = 450 + 100 * np.sin(2 * np.pi * t / day) + rng.normal(0, 5, rows)
+    spikes = rng.choice(rows, SPIKES, replace=False)
+    co2[spikes] += 2000
+    celsius = 22 + 3 * np.sin(2 * np.pi * t / day) + rng.normal(0, 0.1, rows)
+    index = pd.to_datetime(1_600_000_000 * 10**9 + t * 10**9, utc=True)
+    df = pd.DataFrame({"CO2 ppm": co2, "Celsius": celsius}, index=index)
+    return df, index[spikes]
+
+
+def stride(df, points):
+    return df[:: max(len(df) // points, 1)]
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    df, spikes = make_frame(rows)
+    print(f"{rows} rows -> {POINTS} points, {SPIKES} CO2 spikes")
+    methods = [
+        ("stride", stride),
+        (LTTB, lambda df, points: decimate_frame(df, points, LTTB)),
+        (MINMAX, lambda df, points: decimate_frame(df, points, MINMAX)),
+    ]
+    for name, func in methods:
+        start = perf_counter()
+        out = func(df, POINTS)
+        elapsed = perf_counter() - start
+        kept = np.isin(spikes, out.index).sum()
+        print(
+            f"{name:6s}: {elapsed * 1000:7.1f} ms, {len(out):5d} rows, "
+            f"{kept:2d}/{SPIKES} spikes kept"
+        )
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+"""Count I2C transactions of the sensor drivers against a fake SMBus
+
+No hardware is required. Every SMBus call is one bus transaction,
+so the counts show the bus cost of construction and of one sample.
+
+usage: python3 bench_i2c.py
+"""
+
+import os
+import struct
+import tempfile
+
+import bme280
+from bme280 import BME280
+from ccs811 import CCS811
+from i2c_bus import I2CBus
+
+# Trimming parameters and raw ADC values of a real BME280.
+BME280_DIG_T = (27504, 26435, -1000)
+BME280_DIG_P = (36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000)
+BME280_CALIB_TP = struct.pack("<HhhHhhhhhhhh", *BME280_DIG_T, *BME280_DIG_P)
+BME280_CALIB_TP += bytes([0x00, 75])  # 0xA0 (unused), dig_H1
+BME280_CALIB_H = bytes([0x6A, 0x01, 0x00, 0x13, 0x2A, 0x03, 0x1E])
+BME280_DATA = bytes([0x65, 0x5A, 0xC0, 0x7E, 0xED, 0x00, 0x6E, 0x8D])
+BME280_ADDRESS = 0x77
+
+# ALG_RESULT_DATA: eCO2 500 ppm, TVOC 15 ppb, STATUS FW_MODE|APP_VALID|DATA_READY
+CCS811_RESULT = bytes([0x01, 0xF4, 0x00, 0x0F, 0x98, 0x00, 0x18, 0x3C])
+CCS811_ADDRESS = 0x5B
+
+
+class FakeSMBus:
+    """Register-map backed stand-in for smbus2.SMBus
+    A BME280 at 0x77 and a CCS811 at 0x5B are on the bus.
+    """
+
+    def __init__(self, bus_num=1):
+        self.bus_num = bus_num
+        self.registers = {BME280_ADDRESS: {}, CCS811_ADDRESS: {}}
+        self.transactions = 0
+        self.load(BME280_ADDRESS, 0x88, BME280_CALIB_TP)
+        self.load(BME280_ADDRESS, 0xE1, BME280_CALIB_H)
+        self.load(BME280_ADDRESS, 0xF7, BME280_DATA)
+        self.load(BME280_ADDRESS, 0xD0, [0x60])  # chip ID
+        self.load(CCS811_ADDRESS, 0x00, CCS811_RESULT[4:5])  # STATUS
+        self.load(CCS811_ADDRESS, 0x02, CCS811_RESULT)
+
+    def load(self, i2c_addr, register, data):
+        for i, value in enumerate(data):
+            self.registers[i2c_addr][register + i] = value
+
+    def read_byte_data(self, i2c_addr, register):
+        self.transactions += 1
+        return self.registers[i2c_addr].get(register, 0)
+
+    def write_byte_data(self, i2c_addr, register, value):
+        self.transactions += 1
+        self.registers[i2c_addr][register] = value
+
+    def read_i2c_block_data(self, i2c_addr, register, length):
+        self.transactions += 1
+        return [self.registers[i2c_addr].get(register + i, 0) for i in range(length)]
+
+    def write_i2c_block_data(self, i2c_addr, register, data):
+        # Mailbox registers (APP_START, ENV_DATA) are not read back.
+        self.transactions += 1
+
+    def close(self):
+        pass
+
+
+def count_bme280(burst, profile=bme280.DEFAULT_PROFILE, calib_cache=None):
+    """Return (init transactions, transactions per sample, sample)"""
+    i2c = I2CBus(smbus_factory=FakeSMBus)
+    sensor = BME280(burst=burst, profile=profile, calib_cache=calib_cache, bus=i2c)
+    bus = i2c.smbus
+    init = bus.transactions
+    sample = sensor.get()
+    return init, bus.transactions - init, sample
+
+
+def count_ccs811():
+    """Return (init transactions, transactions per sample, sample)"""
+    i2c = I2CBus(smbus_factory=FakeSMBus)
+    sensor = CCS811(bus=i2c)
+    bus = i2c.smbus
+    init = bus.transactions
+    sample = sensor.get()
+    return init, bus.transactions - init, sample
+
+
+if __name__ == "__main__":
+    results = {}
+    for burst in (False, True):
+        init, per_sample, sample = count_bme280(burst)
+        results[burst] = sample
+        mode = "burst " if burst else "single"
+        print(
+            f"BME280 {mode}: init {init:2d} transactions, "
+            f"get() {per_sample:2d} transactions"
+        )
+    init, per_sample, _ = count_bme280(True, "weather_monitoring")
+    print(
+        f"BME280 forced: init {init:2d} transactions, "
+        f"get() {per_sample:2d} transactions"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        calib_cache = os.path.join(directory, "calib.json")
+        count_bme280(True, "weather_monitoring", calib_cache)
+        init, per_sample, _ = count_bme280(True, "weather_monitoring", calib_cache)
+    print(
+        f"BME280 cached: init {init:2d} transactions, "
+        f"get() {per_sample:2d} transactions"
+    )
+    p, t, h = results[True]
+    print(f"sample: {p:7.2f} hPa, {t:6.2f} C, {h:5.2f} %")
+    assert results[True] == results[False]
+
+    init, per_sample, (voc, co2) = count_ccs811()
+    print(
+        f"CCS811       : init {init:2d} transactions, "
+        f"get() {per_sample:2d} transactions"
+    )
+    print(f"sample: TVOC:{voc:4d} ppb, eCO2:{co2:4d} ppm")
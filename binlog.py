@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+"""Append-only binary log of sensor samples
+
+A fixed-width alternative to dump_data.csv. The file is a small header
+followed by packed records, so it can be memory-mapped as a NumPy
+structured array instead of being parsed.
+
+    offset 0   magic    8 bytes  b"I2CSLOG\\0"
+    offset 8   version  uint16
+    offset 10  header   uint16   size of the whole header
+    offset 12  record   uint32   size of one record
+    offset 16  schema   JSON     [[name, numpy dtype string], ...]
+                                 zero padded to the header size
+
+The first field is "time", int64 nanoseconds since epoch (UTC).
+
+Each flush() ends the file with a 16 byte commit trailer
+(b"I2CSEND\0" and the uint64 record count), which the next append
+overwrites. Readers take the count from a valid trailer. Without one
+(e.g. power loss while writing) only whole records are read, and the
+next writer truncates the torn record.
+
+require: pip install numpy (pandas for to_dataframe and the converter)
+
+usage: python3 binlog.py dump_data.csv dump_data.bin
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from ring_buffer import to_ns
+
+MAGIC = b"I2CSLOG\0"
+VERSION = 1
+_HEADER = struct.Struct("<8sHHI")
+_HEADER_ALIGN = 64
+TRAILER_MAGIC = b"I2CSEND\0"
+_TRAILER = struct.Struct("<8sQ")
+
+SENSOR_DTYPE = np.dtype(
+    [
+        ("time", "<i8"),
+        ("co2", "<f4"),
+        ("celsius", "<f4"),
+        ("humidity", "<f4"),
+        ("pressure", "<f4"),
+    ]
+)
+# Field name -> column name of dump_data.csv
+CSV_COLUMNS = {
+    "co2": "CO2 ppm",
+    "celsius": "Celsius",
+    "humidity": "Humidity %",
+    "pressure": "Pressure hPa",
+}
+
+
+def _encode_header(dtype):
+    schema = json.dumps([[name, dtype[name].str] for name in dtype.names])
+    schema = schema.encode("utf-8")
+    size = _HEADER.size + len(schema)
+    size = (size + _HEADER_ALIGN - 1) // _HEADER_ALIGN * _HEADER_ALIGN
+    header = _HEADER.pack(MAGIC, VERSION, size, dtype.itemsize) + schema
+    return header.ljust(size, b"\0")
+
+
+def read_header(f):
+    """Return (record dtype, header size) of an open binary log"""
+    f.seek(0)
+    magic, version, size, record_size = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("not a sensor binary log")
+    if version != VERSION:
+        raise ValueError(f"unsupported binary log version: {version}")
+    schema = f.read(size - _HEADER.size).rstrip(b"\0")
+    dtype = np.dtype([tuple(field) for field in json.loads(schema)])
+    if dtype.itemsize != record_size:
+        raise ValueError("broken binary log header")
+    return dtype, size
+
+
+def _committed_records(f, dtype, header_size):
+    """Return (number of records, has trailer) of an open binary log"""
+    size = f.seek(0, os.SEEK_END)
+    if size >= header_size + _TRAILER.size:
+        f.seek(size - _TRAILER.size)
+        magic, count = _TRAILER.unpack(f.read(_TRAILER.size))
+        if (
+            magic == TRAILER_MAGIC
+            and header_size + count * dtype.itemsize + _TRAILER.size == size
+        ):
+            return count, True
+    # Torn or not committed, whole records only
+    return max(size - header_size, 0) // dtype.itemsize, False
+
+
+class BinLogWriter:
+    """Append records to a binary log
+    An existing file must have the same schema.
+
+    param:
+        path (str): log file
+        dtype (numpy.dtype): record layout, "time" must be the first field
+    """
+
+    def __init__(self, path, dtype=SENSOR_DTYPE):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        if self.dtype.names[0] != "time":
+            raise ValueError('the first field must be "time"')
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.f = open(path, "r+b")
+            dtype, self.header_size = read_header(self.f)
+            if dtype != self.dtype:
+                self.f.close()
+                raise ValueError(f"schema mismatch: {dtype} != {self.dtype}")
+            self.records, trailer = _committed_records(
+                self.f, self.dtype, self.header_size
+            )
+            end = self.header_size + self.records * self.dtype.itemsize
+            if not trailer:
+                # Drop a torn record at the end
+                self.f.truncate(end)
+            self.f.seek(end)
+        else:
+            self.f = open(path, "wb")
+            header = _encode_header(self.dtype)
+            self.header_size = len(header)
+            self.records = 0
+            self.f.write(header)
+        self._end = self.f.tell()  # end of the records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, timestamp, values):
+        """Append one sample
+        param:
+            timestamp (datetime or int): int is nanoseconds since epoch
+            values (sequence of float): in the order of the fields after time
+        """
+        record = np.empty(1, dtype=self.dtype)
+        record[0] = (to_ns(timestamp), *values)
+        self.write(record)
+
+    def write(self, records):
+        """Append a structured array of records"""
+        records = np.asarray(records, dtype=self.dtype)
+        if self.f.tell() != self._end:
+            # Overwrite the trailer
+            self.f.seek(self._end)
+        self.f.write(records.tobytes())
+        self._end += records.nbytes
+        self.records += len(records)
+
+    def flush(self, sync=False):
+        """Commit the appended records with a trailer
+        param: sync (bool): also fsync() to make them durable
+        """
+        if self.f.tell() == self._end:
+            self.f.write(_TRAILER.pack(TRAILER_MAGIC, self.records))
+        self.f.flush()
+        if sync:
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+def load(path):
+    """Memory-map a binary log
+    return: read-only numpy structured array (numpy.memmap)
+    """
+    with open(path, "rb") as f:
+        dtype, header_size = read_header(f)
+        records, _ = _committed_records(f, dtype, header_size)
+    if records == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=header_size, shape=(records,))
+
+
+def to_dataframe(records, start=None):
+    """Convert records to a pandas.DataFrame like dump_data.csv
+    Columns are named as in the CSV, the index is the UTC "Date".
+    param: start (datetime or int): skip records before start
+    """
+    import pandas as pd
+
+    if start is not None:
+        records = records[np.searchsorted(records["time"], to_ns(start)) :]
+    names = records.dtype.names[1:]
+    df = pd.DataFrame({CSV_COLUMNS.get(name, name): records[name] for name in names})
+    df.index = pd.to_datetime(records["time"], utc=True)
+    df.index.name = "Date"
+    return df
+
+
+def csv_to_binlog(csv_path, out_path):
+    """Append the samples of a dump_data.csv to a binary log
+    return: number of converted samples
+    """
+    import pandas as pd
+
+    df = pd.read_csv(csv_path, skipinitialspace=True)
+    records = np.empty(len(df), dtype=SENSOR_DTYPE)
+    times = pd.to_datetime(df["Date"]).to_numpy("datetime64[ns]")
+    records["time"] = times.view(np.int64)
+    for name, column in CSV_COLUMNS.items():
+        records[name] = df[column]
+    with BinLogWriter(out_path) as writer:
+        writer.write(records)
+    return len(records)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print(f"usage: {sys.argv[0]} dump_data.csv dump_data.bin")
+        sys.exit(1)
+    count = csv_to_binlog(sys.argv[1], sys.argv[2])
+    print(f"converted {count} samples")
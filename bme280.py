@@ -23,21 +23,231 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from smbus2 import SMBus
+import asyncio
+import struct
+from time import monotonic, sleep
+
+from i2c_bus import I2CBus
+from json_cache import load_json, save_json
+
+CALIB_TP_REG = 0x88
+CALIB_TP_LEN = 26  # 0x88..0xA1
+CALIB_H_REG = 0xE1
+CALIB_H_LEN = 7  # 0xE1..0xE7
+CTRL_HUM_REG = 0xF2
+CTRL_MEAS_REG = 0xF4
+CONFIG_REG = 0xF5
+DATA_REG = 0xF7
+DATA_LEN = 8  # 0xF7..0xFE
+STATUS_REG = 0xF3
+CALIB_T_LEN = 6  # 0x88..0x8D, dig_T1..dig_T3
+
+CALIB_CACHE_PATH = "~/.cache/i2c_env_sensors/bme280_calib.json"
+
+STATUS_MEASURING_BIT = 1 << 3
+STATUS_POLL_RETRY = 10
+
+MODE_SLEEP = 0x00
+MODE_FORCED = 0x01
+MODE_NORMAL = 0x03
+
+# osrs_x register value -> oversampling factor (0 is skipped, 5..7 are x16)
+OVERSAMPLING = (0, 1, 2, 4, 8, 16, 16, 16)
+
+PROFILES = {
+    "weather_monitoring": dict(
+        mode=MODE_FORCED, osrs_t=1, osrs_p=1, osrs_h=1, t_sb=0, filter=0
+    ),
+    "indoor_navigation": dict(
+        mode=MODE_NORMAL, osrs_t=2, osrs_p=5, osrs_h=1, t_sb=0, filter=4
+    ),
+    "low_latency": dict(
+        mode=MODE_NORMAL, osrs_t=1, osrs_p=3, osrs_h=1, t_sb=0, filter=4
+    ),
+}
+DEFAULT_PROFILE = "indoor_navigation"
+# Valid values of the profile settings, the others are 3 bit fields
+SETTING_VALUES = dict(
+    mode=(MODE_FORCED, MODE_NORMAL),
+    osrs_t=range(8),
+    osrs_p=range(8),
+    osrs_h=range(8),
+    t_sb=range(8),
+    filter=range(8),
+)
+
+
+def measurement_time(osrs_t, osrs_p, osrs_h):
+    """Return maximum measurement time in seconds
+    Datasheet 9.1 "Measurement time".
+    param: osrs_t, osrs_p, osrs_h (int): oversampling register values
+    """
+    t, p, h = OVERSAMPLING[osrs_t], OVERSAMPLING[osrs_p], OVERSAMPLING[osrs_h]
+    msec = 1.25 + 2.3 * t
+    if p:
+        msec += 2.3 * p + 0.575
+    if h:
+        msec += 2.3 * h + 0.575
+    return msec / 1000
+
+
+def compensate_arrays(digT, digP, digH, pres_raw, temp_raw, hum_raw, fixed_point=False):
+    """Compensate arrays of raw ADC values in one vectorized pass
+    Requires numpy. Invalid raw values (0x80000 for pressure, 0x8000 for
+    humidity, i.e. skipped or not yet measured) become NaN.
+
+    param:
+        digT, digP, digH (list): trimming parameters
+        pres_raw, temp_raw, hum_raw (array like): raw ADC values
+        fixed_point (bool): use the datasheet integer algorithms
+            (32 bit temperature/humidity, 64 bit pressure) instead of
+            the floating point ones
+    return: pressure hPa, temperature Celsius degree, humidity %
+        (numpy.ndarray of float64)
+    """
+    import numpy as np
+
+    adc_P = np.asarray(pres_raw, dtype=np.int64)
+    adc_T = np.asarray(temp_raw, dtype=np.int64)
+    adc_H = np.asarray(hum_raw, dtype=np.int64)
+    if fixed_point:
+        pressure, temperature, humidity = _compensate_int(
+            np, digT, digP, digH, adc_P, adc_T, adc_H
+        )
+    else:
+        pressure, temperature, humidity = _compensate_float(
+            np, digT, digP, digH, adc_P, adc_T, adc_H
+        )
+    pressure[adc_P >= 0x80000] = np.nan
+    humidity[adc_H == 0x8000] = np.nan
+    return pressure, temperature, humidity
+
+
+def _compensate_float(np, digT, digP, digH, adc_P, adc_T, adc_H):
+    """Vectorized form of BME280._compensate_T/_P/_H"""
+    T1, T2, T3 = digT
+    P1, P2, P3, P4, P5, P6, P7, P8, P9 = digP
+    H1, H2, H3, H4, H5, H6 = digH
+
+    v1 = (adc_T / 16384.0 - T1 / 1024.0) * T2
+    v2 = (adc_T / 131072.0 - T1 / 8192.0) ** 2 * T3
+    t_fine = v1 + v2
+    temperature = t_fine / 5120.0
+
+    v1 = (t_fine / 2.0) - 64000.0
+    v2 = (((v1 / 4.0) * (v1 / 4.0)) / 2048) * P6
+    v2 = v2 + ((v1 * P5) * 2.0)
+    v2 = (v2 / 4.0) + (P4 * 65536.0)
+    v1 = (((P3 * (((v1 / 4.0) * (v1 / 4.0)) / 8192)) / 8) + ((P2 * v1) / 2.0)) / 262144
+    v1 = ((32768 + v1) * P1) / 32768
+    invalid = v1 == 0
+    v1 = np.where(invalid, 1.0, v1)
+    pressure = (((1048576 - adc_P) - (v2 / 4096)) * 3125) * 2.0 / v1
+    v1 = (P9 * (((pressure / 8.0) * (pressure / 8.0)) / 8192.0)) / 4096
+    v2 = ((pressure / 4.0) * P8) / 8192.0
+    pressure = pressure + ((v1 + v2 + P7) / 16.0)
+    pressure = np.where(invalid, 0.0, pressure / 100)
+
+    var_h = t_fine - 76800.0
+    humidity = (adc_H - (H4 * 64.0 + H5 / 16384.0 * var_h)) * (
+        H2 / 65536.0 * (1.0 + H6 / 67108864.0 * var_h * (1.0 + H3 / 67108864.0 * var_h))
+    )
+    humidity = humidity * (1.0 - H1 * humidity / 524288.0)
+    humidity = np.where(var_h == 0, 0.0, np.clip(humidity, 0.0, 100.0))
+
+    return pressure, temperature, humidity
+
+
+def _compensate_int(np, digT, digP, digH, adc_P, adc_T, adc_H):
+    """Datasheet 4.2.3 / 8.2 fixed-point compensation in int64 arithmetic"""
+    T1, T2, T3 = digT
+    P1, P2, P3, P4, P5, P6, P7, P8, P9 = digP
+    H1, H2, H3, H4, H5, H6 = digH
+
+    var1 = (((adc_T >> 3) - (T1 << 1)) * T2) >> 11
+    var2 = (((((adc_T >> 4) - T1) * ((adc_T >> 4) - T1)) >> 12) * T3) >> 14
+    t_fine = var1 + var2
+    temperature = ((t_fine * 5 + 128) >> 8) / 100.0  # 0.01 degC
+
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * P6
+    var2 = var2 + ((var1 * P5) << 17)
+    var2 = var2 + (np.int64(P4) << 35)
+    var1 = ((var1 * var1 * P3) >> 8) + ((var1 * P2) << 12)
+    var1 = (((np.int64(1) << 47) + var1) * P1) >> 33
+    invalid = var1 == 0
+    var1 = np.where(invalid, 1, var1)
+    p = 1048576 - adc_P
+    # numerator and denominator are positive, so floor division matches C
+    p = (((p << 31) - var2) * 3125) // var1
+    var1 = (P9 * (p >> 13) * (p >> 13)) >> 25
+    var2 = (P8 * p) >> 19
+    p = ((p + var1 + var2) >> 8) + (np.int64(P7) << 4)
+    pressure = np.where(invalid, 0.0, p / 25600.0)  # Q24.8 Pa -> hPa
+
+    v_x1 = t_fine - 76800
+    v_x1 = ((((adc_H << 14) - (H4 << 20) - (H5 * v_x1)) + 16384) >> 15) * (
+        (
+            (((((v_x1 * H6) >> 10) * (((v_x1 * H3) >> 11) + 32768)) >> 10) + 2097152)
+            * H2
+            + 8192
+        )
+        >> 14
+    )
+    v_x1 = v_x1 - (((((v_x1 >> 15) * (v_x1 >> 15)) >> 7) * H1) >> 4)
+    v_x1 = np.clip(v_x1, 0, 419430400)
+    humidity = (v_x1 >> 12) / 1024.0  # Q22.10 %RH
+
+    return pressure, temperature.astype(np.float64), humidity
+
+
+def _valid_calib_entry(entry, digT):
+    """Cheap check of a cached calibration entry
+    param: digT (list): read from the sensor, every chip is trimmed
+        differently, so a replaced sensor does not match
+    """
+    try:
+        return (
+            entry["digT"] == digT
+            and len(entry["digT"]) == 3
+            and len(entry["digP"]) == 9
+            and len(entry["digH"]) == 6
+            and all(
+                isinstance(v, int) for k in ("digT", "digP", "digH") for v in entry[k]
+            )
+            # dig_T1 and dig_P1 are never 0 on a trimmed chip
+            and entry["digT"][0] != 0
+            and entry["digP"][0] != 0
+        )
+    except (TypeError, KeyError):
+        return False
 
 
 class BME280:
     """BME280: Combined humidity and pressure sensor
     https://cdn.sparkfun.com/assets/learn_tutorials/4/1/9/BST-BME280_DS001-10.pdf
 
-    Settings and performance for indoor navigation
+    Operating profiles (datasheet 3.5 "Recommended modes of operation")
+
+    weather_monitoring:  forced mode, oversampling ×1/×1/×1, filter off
+                         Lowest power. One conversion per get().
+    indoor_navigation:   normal mode, tstandby = 0.5 ms,
+                         pressure ×16, temperature ×2, humidity ×1,
+                         filter coefficient 16 (default)
+    low_latency:         normal mode, tstandby = 0.5 ms,
+                         pressure ×4, temperature ×1, humidity ×1,
+                         filter coefficient 16
+
+    A custom profile is given as a dict of the keys in PROFILES with the
+    values of SETTING_VALUES, missing keys are taken from the default profile.
+
+    calib_cache: path of a JSON file (e.g. CALIB_CACHE_PATH) that keeps
+    the trimming parameters between processes. None reads them every time.
+
+    bus: I2CBus to use. By default the shared bus of bus_num is opened.
 
-    Suggested settings for indoor navigation
-    Sensor mode:           normal mode, tstandby = 0.5 ms
-    Oversampling settings: pressure ×16, temperature ×2, humidity ×1
-    IIR filter settings:    filter coefficient 16
+    Performance for indoor navigation
 
-    Performance for suggested settings
     Current consumption: 633 µA
     RMS Noise:           0.2 Pa / 1.7 cm
     Data output rate:    25Hz
@@ -47,73 +257,206 @@ class BME280:
     refer: https://github.com/SWITCHSCIENCE/samplecodes/blob/master/BME280/Python27/bme280_sample.py
     """
 
-    def __init__(self, bus_num=1, i2c_address=0x77):
-        self.i2c = SMBus(bus_num)
+    # Names of the values returned by get()
+    FIELDS = ("pressure", "temperature", "humidity")
+
+    def __init__(
+        self,
+        bus_num=1,
+        i2c_address=0x77,
+        burst=True,
+        profile=DEFAULT_PROFILE,
+        calib_cache=None,
+        bus=None,
+    ):
+        # Share the bus with the other drivers unless one is given.
+        self._own_bus = bus is None
+        self.i2c = I2CBus.open(bus_num) if bus is None else bus
+        self.bus_num = self.i2c.bus_num
         self.i2c_address = i2c_address
+        # Burst mode reads each register block in a single I2C transaction.
+        # Disable it for adapters that do not support I2C block reads.
+        self.burst = burst
         self.t_fine = 0.0
         self.pressure = 0.0
         self.temperature = 0.0
         self.humidity = 0.0
 
-        # Fixed settings
-        osrs_t = 2  # Temperature oversampling x2
-        osrs_p = 5  # Pressure oversampling x16
-        osrs_h = 1  # Humidity oversampling x1
-        mode = 3  # Normal mode
-        t_sb = 0  # tstandby 0.5 ms
-        filter = 4  # Filter x16
-
-        self.i2c.write_byte_data(self.i2c_address, 0xF2, osrs_h)
-        self.i2c.write_byte_data(
-            self.i2c_address, 0xF4, (osrs_t << 5) | (osrs_p << 2) | mode
-        )
-        self.i2c.write_byte_data(self.i2c_address, 0xF5, (t_sb << 5) | (filter << 2))
+        with self.i2c.lock:
+            self.configure(profile)
+            if calib_cache is None:
+                self._get_calib_param()
+            else:
+                self._load_calib_param(calib_cache)
+
+    def close(self):
+        """Release the bus if it was opened by this instance"""
+        if self._own_bus:
+            self.i2c.close()
+
+    def reinit(self):
+        """Re-open the bus and initialize the sensor again
+        For recovery from bus errors or a reset of the sensor: the profile
+        is written and the calibration is read from the sensor again.
+        """
+        self.i2c.reopen()
+        with self.i2c.lock:
+            self.configure(self.profile)
+            self._get_calib_param()
 
-        self._get_calib_param()
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def configure(self, profile=DEFAULT_PROFILE):
+        """Apply an operating profile
+        param: profile (str or dict): name in PROFILES or custom settings
+        """
+        if isinstance(profile, str):
+            if profile not in PROFILES:
+                raise ValueError(f"Unknown profile: {profile}")
+            settings = PROFILES[profile]
+        else:
+            unknown = set(profile) - set(PROFILES[DEFAULT_PROFILE])
+            if unknown:
+                raise ValueError(f"Unknown settings: {sorted(unknown)}")
+            settings = {**PROFILES[DEFAULT_PROFILE], **profile}
+        for key, value in settings.items():
+            if not isinstance(value, int) or value not in SETTING_VALUES[key]:
+                raise ValueError(f"Invalid {key}: {value!r}")
+
+        self.profile = profile
+        self.mode = settings["mode"]
+        self.osrs_t = settings["osrs_t"]
+        self.osrs_p = settings["osrs_p"]
+        self.osrs_h = settings["osrs_h"]
+        self.t_sb = settings["t_sb"]
+        self.filter = settings["filter"]
+        self.measurement_time = measurement_time(self.osrs_t, self.osrs_p, self.osrs_h)
+
+        # Writes to config may be ignored in normal mode, so go to sleep first.
+        # ctrl_hum becomes effective after the following write to ctrl_meas.
+        with self.i2c.lock:
+            self.i2c.write_byte_data(self.i2c_address, CTRL_MEAS_REG, MODE_SLEEP)
+            self.i2c.write_byte_data(self.i2c_address, CTRL_HUM_REG, self.osrs_h)
+            self.i2c.write_byte_data(
+                self.i2c_address, CONFIG_REG, (self.t_sb << 5) | (self.filter << 2)
+            )
+            self.i2c.write_byte_data(self.i2c_address, CTRL_MEAS_REG, self._ctrl_meas())
+        # The first result in normal mode is available after one conversion.
+        self._ready_at = monotonic() + self.measurement_time
+
+    def _ctrl_meas(self):
+        return (self.osrs_t << 5) | (self.osrs_p << 2) | self.mode
+
+    def _read_block(self, register, length):
+        """Read `length` bytes starting at `register`
+        In burst mode this is one I2C transaction, otherwise one per byte.
+        """
+        if self.burst:
+            return self.i2c.read_i2c_block_data(self.i2c_address, register, length)
+        with self.i2c.lock:
+            return [
+                self.i2c.read_byte_data(self.i2c_address, a)
+                for a in range(register, register + length)
+            ]
 
     def _get_calib_param(self):
-        calib = []
+        # 0x88..0xA1 holds digT, digP and dig_H1 (0xA0 is unused),
+        # 0xE1..0xE7 holds dig_H2..dig_H6.
+        calib = self._read_block(CALIB_TP_REG, CALIB_TP_LEN)
+        calib += self._read_block(CALIB_H_REG, CALIB_H_LEN)
+        self._decode_calib_param(bytes(calib))
+
+    def _load_calib_param(self, path=CALIB_CACHE_PATH):
+        """Load trimming parameters from the cache file at path
+        The entry is keyed by bus and address and validated against
+        dig_T1..dig_T3 of the sensor, which costs one 6 byte read instead
+        of the calibration blocks. A missing or mismatching entry (e.g. of
+        a replaced sensor) is re-read and saved.
+        """
+        calib = self._read_block(CALIB_TP_REG, CALIB_T_LEN)
+        digT = list(struct.unpack("<Hhh", bytes(calib)))
+        key = f"{self.bus_num}:{self.i2c_address:#04x}"
+        cache = load_json(path)
+        entry = cache.get(key)
+        if _valid_calib_entry(entry, digT):
+            self.digT = list(entry["digT"])
+            self.digP = list(entry["digP"])
+            self.digH = list(entry["digH"])
+            return
+
+        self._get_calib_param()
+        cache[key] = dict(digT=self.digT, digP=self.digP, digH=self.digH)
+        save_json(path, cache)
+
+    def _decode_calib_param(self, calib):
+        """Decode trimming parameters from the raw calibration buffer
+        param: calib (bytes): 0x88..0xA1 followed by 0xE1..0xE7
+        """
+        t1, t2, t3, p1, p2, p3, p4, p5, p6, p7, p8, p9 = struct.unpack_from(
+            "<HhhHhhhhhhhh", calib, 0
+        )
+        h1 = calib[25]
+        h2, h3 = struct.unpack_from("<hB", calib, 26)
+        e4, e5, e6 = calib[29], calib[30], calib[31]
+        # dig_H4 and dig_H5 are 12 bit signed values sharing 0xE5
+        h4 = (e4 << 4) | (e5 & 0x0F)
+        h5 = (e6 << 4) | ((e5 >> 4) & 0x0F)
+        h4 = h4 - 0x1000 if h4 & 0x800 else h4
+        h5 = h5 - 0x1000 if h5 & 0x800 else h5
+        (h6,) = struct.unpack_from("<b", calib, 32)
+
         # Update by every call
-        self.digT = []
-        self.digP = []
-        self.digH = []
-
-        for i in range(0x88, 0x88 + 24):
-            calib.append(self.i2c.read_byte_data(self.i2c_address, i))
-        calib.append(self.i2c.read_byte_data(self.i2c_address, 0xA1))
-        for i in range(0xE1, 0xE1 + 7):
-            calib.append(self.i2c.read_byte_data(self.i2c_address, i))
-
-        self.digT.append((calib[1] << 8) | calib[0])
-        self.digT.append((calib[3] << 8) | calib[2])
-        self.digT.append((calib[5] << 8) | calib[4])
-        self.digP.append((calib[7] << 8) | calib[6])
-        self.digP.append((calib[9] << 8) | calib[8])
-        self.digP.append((calib[11] << 8) | calib[10])
-        self.digP.append((calib[13] << 8) | calib[12])
-        self.digP.append((calib[15] << 8) | calib[14])
-        self.digP.append((calib[17] << 8) | calib[16])
-        self.digP.append((calib[19] << 8) | calib[18])
-        self.digP.append((calib[21] << 8) | calib[20])
-        self.digP.append((calib[23] << 8) | calib[22])
-        self.digH.append(calib[24])
-        self.digH.append((calib[26] << 8) | calib[25])
-        self.digH.append(calib[27])
-        self.digH.append((calib[28] << 4) | (0x0F & calib[29]))
-        self.digH.append((calib[30] << 4) | ((calib[29] >> 4) & 0x0F))
-        self.digH.append(calib[31])
-
-        for i in range(1, 2):
-            if self.digT[i] & 0x8000:
-                self.digT[i] = (-self.digT[i] ^ 0xFFFF) + 1
-
-        for i in range(1, 8):
-            if self.digP[i] & 0x8000:
-                self.digP[i] = (-self.digP[i] ^ 0xFFFF) + 1
-
-        for i in range(0, 6):
-            if self.digH[i] & 0x8000:
-                self.digH[i] = (-self.digH[i] ^ 0xFFFF) + 1
+        self.digT = [t1, t2, t3]
+        self.digP = [p1, p2, p3, p4, p5, p6, p7, p8, p9]
+        self.digH = [h1, h2, h3, h4, h5, h6]
+
+    def _trigger(self):
+        """Start a conversion in forced mode"""
+        if self.mode == MODE_FORCED:
+            self.i2c.write_byte_data(self.i2c_address, CTRL_MEAS_REG, self._ctrl_meas())
+            self._ready_at = monotonic() + self.measurement_time
+
+    def _measuring(self):
+        """Return True while a forced mode conversion is running"""
+        if self.mode != MODE_FORCED:
+            return False
+        status = self.i2c.read_byte_data(self.i2c_address, STATUS_REG)
+        return (status & STATUS_MEASURING_BIT) != 0
+
+    def _wait_measurement(self):
+        """Wait until a completed measurement is in the data registers
+        In forced mode a new conversion is started and the status register
+        is polled after the datasheet measurement time.
+        """
+        self._trigger()
+        wait = self._ready_at - monotonic()
+        if wait > 0:
+            sleep(wait)
+
+        # The maximum measurement time is an upper bound,
+        # so this normally succeeds on the first poll.
+        for _ in range(STATUS_POLL_RETRY):
+            if not self._measuring():
+                return
+            sleep(self.measurement_time / STATUS_POLL_RETRY)
+        raise TimeoutError("BME280 measurement did not complete")
+
+    async def _wait_measurement_async(self):
+        """Asynchronous _wait_measurement(), bus I/O runs in a thread"""
+        await asyncio.to_thread(self._trigger)
+        wait = self._ready_at - monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        for _ in range(STATUS_POLL_RETRY):
+            if not await asyncio.to_thread(self._measuring):
+                return
+            await asyncio.sleep(self.measurement_time / STATUS_POLL_RETRY)
+        raise TimeoutError("BME280 measurement did not complete")
 
     def get(self):
         """Get pressure, temperature, humidity
@@ -121,9 +464,24 @@ class BME280:
         temperature: Celsius degree (float)
         humidity: % (float)
         """
-        data = [
-            self.i2c.read_byte_data(self.i2c_address, a) for a in range(0xF7, 0xF7 + 8)
-        ]
+        self._wait_measurement()
+        # Burst read is required to prevent a mix-up of bytes belonging to
+        # different measurements.
+        data = self._read_block(DATA_REG, DATA_LEN)
+        return self._decode_data(data)
+
+    async def get_async(self):
+        """Asynchronous get()
+        Awaits the measurement time instead of sleeping and runs the bus
+        I/O in a worker thread, so several sensors can be read in parallel
+        with asyncio.gather().
+        """
+        await self._wait_measurement_async()
+        data = await asyncio.to_thread(self._read_block, DATA_REG, DATA_LEN)
+        return self._decode_data(data)
+
+    def _decode_data(self, data):
+        """Compensate the 8 bytes of 0xF7..0xFE and update the values"""
         pres_raw = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
         temp_raw = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
         hum_raw = (data[6] << 8) | data[7]
@@ -132,10 +490,28 @@ class BME280:
         if pres_raw < 0x80000:
             # Sometimes get strange value
             self.pressure = self._compensate_P(pres_raw)
-        self.humidity = self._compensate_H(hum_raw)
+        if hum_raw != 0x8000:
+            # 0x8000 is the reset value when humidity is skipped
+            self.humidity = self._compensate_H(hum_raw)
 
         return self.pressure, self.temperature, self.humidity
 
+    def compensate_batch(self, pres_raw, temp_raw, hum_raw, fixed_point=False):
+        """Compensate arrays of raw ADC values with this sensor's calibration
+        See compensate_arrays(). Does not touch the bus or the instance state.
+        return: pressure hPa, temperature Celsius degree, humidity %
+            (numpy.ndarray)
+        """
+        return compensate_arrays(
+            self.digT,
+            self.digP,
+            self.digH,
+            pres_raw,
+            temp_raw,
+            hum_raw,
+            fixed_point=fixed_point,
+        )
+
     def _compensate_P(self, adc_P):
         """Return compensated hPa value
         param: raw pressure ADC data (int)
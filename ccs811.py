@@ -23,22 +23,65 @@
 # SOFTWARE.
 
 
-from smbus2 import SMBus
+import asyncio
+from time import monotonic, sleep, time
+
+from i2c_bus import I2CBus
+from json_cache import load_json, save_json
 
 
 STATUS_REG = 0x00
 MEAS_MODE_REG = 0x01
 ALG_RESULT_DATA_REG = 0x02
 ENV_DATA_REG = 0x05
+BASELINE_REG = 0x11
 APP_START_REG = 0xF4
+SW_RESET_REG = 0xFF
+SW_RESET_SEQUENCE = [0x11, 0xE5, 0x72, 0x8A]
 
+STATUS_ERROR_BIT = 1 << 0
 STATUS_DATA_READY_BIT = 1 << 3
+STATUS_FW_MODE_BIT = 1 << 7  # 0: boot mode, 1: application mode
+
+BOOT_TIME = 0.02  # sec, from reset to the boot mode accepting APP_START
+APP_START_TIME = 0.001  # sec, from APP_START to the application mode
+
+# ERROR_ID bits
+ERROR_NAMES = {
+    1 << 0: "WRITE_REG_INVALID",
+    1 << 1: "READ_REG_INVALID",
+    1 << 2: "MEASMODE_INVALID",
+    1 << 3: "MAX_RESISTANCE",
+    1 << 4: "HEATER_FAULT",
+    1 << 5: "HEATER_SUPPLY",
+}
 
+ECO2_RANGE = (400, 8192)  # ppm
+TVOC_RANGE = (0, 1187)  # ppb
+
+MODE_IDLE = 0x00
 MODE_1SEC = 0x01
 MODE_10SEC = 0x02
 MODE_60SEC = 0x03
 MODE_250MS = 0x04
 
+# Drive mode -> interval of new results in seconds (None: no measurement)
+MODE_INTERVAL = {
+    MODE_IDLE: None,
+    MODE_1SEC: 1.0,
+    MODE_10SEC: 10.0,
+    MODE_60SEC: 60.0,
+    MODE_250MS: 0.25,
+}
+# Retry interval after a poll found no new result, as a fraction of the interval
+POLL_RETRY_RATIO = 0.1
+
+BASELINE_PATH = "~/.cache/i2c_env_sensors/ccs811_baseline.json"
+BASELINE_SAVE_INTERVAL = 60 * 60  # sec
+BASELINE_MAX_AGE = 7 * 24 * 60 * 60  # sec
+# Do not save the baseline of a sensor that is still conditioning.
+BASELINE_MIN_RUNTIME = 20 * 60  # sec
+
 
 class CCS811:
     """CCS811: ultra-low power digital gas sensor
@@ -49,35 +92,152 @@ class CCS811:
     The Total Volatile Organic Compound (TVOC) output range for
     CCS811 is from 0ppb to 1187ppb.
 
-    MODE settings: 1 sec interval, Disable interrupt
+    MODE settings: MODE_1SEC by default, Disable interrupt
+    The reader only polls when a new result can exist for the drive mode,
+    get() returns the previous values in between.
+    Note: In MODE_250MS only RAW_DATA is updated, eCO2 and TVOC are not.
+
+    The algorithm baseline is lost on every restart. If baseline_file is
+    given, the BASELINE register is saved there every
+    BASELINE_SAVE_INTERVAL once the sensor has run BASELINE_MIN_RUNTIME,
+    and restored at startup if it is younger than BASELINE_MAX_AGE.
 
     param:
         bus_num (int): i2c bus number
         i2c_address (int): Address of CCS811
+        baseline_file (str): path to keep the baseline (e.g. BASELINE_PATH)
+        mode (int): drive mode (MODE_1SEC, MODE_10SEC, MODE_60SEC, ...)
+        bus (I2CBus): bus to use, the shared bus of bus_num by default
     """
 
-    def __init__(self, bus_num=1, i2c_address=0x5B):
-        self.i2c = SMBus(bus_num)
+    # Names of the values returned by get()
+    FIELDS = ("TVOC", "eCO2")
+
+    def __init__(
+        self,
+        bus_num=1,
+        i2c_address=0x5B,
+        baseline_file=None,
+        mode=MODE_1SEC,
+        bus=None,
+    ):
+        # Share the bus with the other drivers unless one is given.
+        self._own_bus = bus is None
+        self.i2c = I2CBus.open(bus_num) if bus is None else bus
+        self.bus_num = self.i2c.bus_num
         self.i2c_address = i2c_address
+        self.baseline_file = baseline_file
+        self.baseline_restored = False
 
         self.status = 0
+        self.error_id = 0
+        self.raw_current = 0  # uA
+        self.raw_adc = 0  # 1.65V / 1023 per LSB
+        self.rejected = None  # why values of the last result were rejected
         self.TVOC = 0
         self.eCO2 = 0
 
-        # Write empty to APP_START to boot.
-        self.i2c.write_i2c_block_data(self.i2c_address, APP_START_REG, [])
-        # settings: 1 sec interval, Disable interrupt
-        meas_mode = (MODE_1SEC << 4) | (0 << 3)
+        self._start(mode)
+
+    def _start(self, mode):
+        with self.i2c.lock:
+            # APP_START is only valid in boot mode, the application may
+            # be running already (e.g. started by an earlier process).
+            status = self.i2c.read_byte_data(self.i2c_address, STATUS_REG)
+            if (status & STATUS_FW_MODE_BIT) == 0:
+                # Write empty to APP_START to boot.
+                self.i2c.write_i2c_block_data(self.i2c_address, APP_START_REG, [])
+                sleep(APP_START_TIME)
+            self.set_mode(mode)
+
+            self._started = monotonic()
+            self._baseline_saved = self._started
+            if self.baseline_file is not None:
+                self.restore_baseline()
+
+    def close(self):
+        """Release the bus if it was opened by this instance"""
+        if self._own_bus:
+            self.i2c.close()
+
+    def reinit(self):
+        """Re-open the bus, reset the sensor and start the application
+        For recovery from bus errors or a hung sensor. The drive mode is
+        set again and the baseline restored from baseline_file.
+        """
+        self.i2c.reopen()
+        self.i2c.write_i2c_block_data(self.i2c_address, SW_RESET_REG, SW_RESET_SEQUENCE)
+        sleep(BOOT_TIME)
+        self._start(self.mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def set_mode(self, mode):
+        """Set drive mode, interrupt is disabled
+        Datasheet: when changing to a mode with a lower sample rate, the
+        sensor should be placed in MODE_IDLE for at least 10 minutes first.
+        """
+        if mode not in MODE_INTERVAL:
+            raise ValueError(f"Unknown drive mode: {mode}")
+        meas_mode = (mode << 4) | (0 << 3)
         self.i2c.write_byte_data(self.i2c_address, MEAS_MODE_REG, meas_mode)
+        self.mode = mode
+        self.interval = MODE_INTERVAL[mode]
+        self._next_poll = monotonic()
 
     @property
-    def ready(self):
-        """Return data ready status"""
-        status = self.i2c.read_byte_data(self.i2c_address, STATUS_REG)
-        if (status & STATUS_DATA_READY_BIT) == 0:
+    def _baseline_key(self):
+        return f"{self.bus_num}:{self.i2c_address:#04x}"
+
+    def read_baseline(self):
+        """Return the current BASELINE register value (int)"""
+        data = self.i2c.read_i2c_block_data(self.i2c_address, BASELINE_REG, 2)
+        return (data[0] << 8) | data[1]
+
+    def write_baseline(self, baseline):
+        """Write a baseline previously read by read_baseline()"""
+        self.i2c.write_i2c_block_data(
+            self.i2c_address, BASELINE_REG, [(baseline >> 8), (baseline & 0xFF)]
+        )
+
+    def save_baseline(self):
+        """Save the current baseline to baseline_file"""
+        baseline = self.read_baseline()
+        baselines = load_json(self.baseline_file)
+        baselines[self._baseline_key] = dict(baseline=baseline, saved_at=time())
+        save_json(self.baseline_file, baselines)
+        self._baseline_saved = monotonic()
+
+    def restore_baseline(self):
+        """Restore the baseline from baseline_file if it is valid
+        return: True if the baseline was written to the sensor
+        """
+        entry = load_json(self.baseline_file).get(self._baseline_key)
+        try:
+            baseline = entry["baseline"]
+            age = time() - entry["saved_at"]
+        except (TypeError, KeyError):
             return False
-        else:
-            return True
+        if not isinstance(baseline, int) or not 0 < baseline < 0xFFFF:
+            return False
+        if not 0 <= age <= BASELINE_MAX_AGE:
+            return False
+
+        self.write_baseline(baseline)
+        self.baseline_restored = True
+        return True
+
+    def _save_baseline_if_due(self):
+        now = monotonic()
+        if now - self._started < BASELINE_MIN_RUNTIME:
+            return
+        if now - self._baseline_saved < BASELINE_SAVE_INTERVAL:
+            return
+        self.save_baseline()
 
     def compensate(self, humidity=50.0, temperature=25.0):
         """Set environment value for compensate
@@ -94,28 +254,92 @@ class CCS811:
         env_data = [(h >> 8), (h & 0xFF), (t >> 8), (t & 0xFF)]
         self.i2c.write_i2c_block_data(self.i2c_address, ENV_DATA_REG, env_data)
 
+    @property
+    def errors(self):
+        """Return names of the error bits in the last ERROR_ID"""
+        return [name for bit, name in ERROR_NAMES.items() if self.error_id & bit]
+
     def update(self):
         """Update TVOC and eCO2 values
-        The values will update if data are available(ready).
+        ALG_RESULT_DATA contains STATUS, ERROR_ID and RAW_DATA after
+        eCO2 and TVOC, so one read gets the values and their state.
+        The values will update if data are available(ready) and valid.
+        The bus is not accessed until a new result can exist.
+        return: (tuple) names of the updated values, "eCO2" and "TVOC",
+            empty (false) if none was updated
         """
-        if self.ready:
-            data = self.i2c.read_i2c_block_data(
-                self.i2c_address, ALG_RESULT_DATA_REG, 8
-            )
-            co2 = (data[0] << 8) | (data[1])
-            voc = (data[2] << 8) | (data[3])
-            # Check range of the values
-            # Skip update the values, when the values sometimes out of range.
-            if 400 < co2 < 8192:
-                self.eCO2 = co2
-            if 0 < voc < 1187:
-                self.TVOC = voc
+        now = monotonic()
+        if self.interval is None or now < self._next_poll:
+            return ()
+
+        data = self.i2c.read_i2c_block_data(self.i2c_address, ALG_RESULT_DATA_REG, 8)
+        updated = self._decode_result(data)
+
+        retry = self.interval * POLL_RETRY_RATIO
+        if self.status & STATUS_DATA_READY_BIT:
+            # The result became ready at most one retry ago.
+            self._next_poll = now + self.interval - retry
+        else:
+            self._next_poll = now + retry
+        return updated
+
+    def _decode_result(self, data):
+        """Decode the 8 bytes of ALG_RESULT_DATA
+        return: (tuple) names of the accepted values
+        """
+        self.status = data[4]
+        self.error_id = data[5]
+        raw = (data[6] << 8) | data[7]
+        self.raw_current = raw >> 10
+        self.raw_adc = raw & 0x3FF
+
+        if (self.status & STATUS_DATA_READY_BIT) == 0:
+            return ()
+        if self.status & STATUS_ERROR_BIT:
+            self.rejected = f"error: {', '.join(self.errors)}"
+            return ()
+
+        co2 = (data[0] << 8) | (data[1])
+        voc = (data[2] << 8) | (data[3])
+        # Check range of the values
+        # Keep the last value of a field that is sometimes out of range.
+        updated = []
+        rejected = []
+        if ECO2_RANGE[0] <= co2 <= ECO2_RANGE[1]:
+            self.eCO2 = co2
+            updated.append("eCO2")
+        else:
+            rejected.append(f"eCO2 out of range: {co2} ppm")
+        if TVOC_RANGE[0] <= voc <= TVOC_RANGE[1]:
+            self.TVOC = voc
+            updated.append("TVOC")
+        else:
+            rejected.append(f"TVOC out of range: {voc} ppb")
+        self.rejected = ", ".join(rejected) or None
+        if not updated:
+            return ()
+
+        if self.baseline_file is not None:
+            self._save_baseline_if_due()
+        return tuple(updated)
 
     def get(self):
         """Return TVOC and eCO2 values"""
         self.update()
         return self.TVOC, self.eCO2
 
+    async def get_async(self):
+        """Asynchronous get()
+        Awaits until a new result can exist for the drive mode, then polls
+        once with the bus I/O in a worker thread.
+        """
+        if self.interval is not None:
+            wait = self._next_poll - monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        await asyncio.to_thread(self.update)
+        return self.TVOC, self.eCO2
+
 
 if __name__ == "__main__":
     from time import sleep
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+"""Text log of sensor samples (dump_data.csv)
+
+    Date, CO2 ppm, Celsius, Humidity %, Pressure hPa
+    2021-05-23 00:00:00.000000, 412, 25.1, 45.2, 1004.3
+
+The writer keeps a sidecar index (dump_data.csv.idx) of the timestamp
+and byte offset of a row every INDEX_INTERVAL bytes, as pairs of int64
+(nanoseconds since epoch, naive times taken as UTC). A range reader
+seeks to the indexed row before the wanted start and parses from there.
+The index can always be rebuilt from the CSV, so it is never fsynced.
+"""
+
+import bisect
+import calendar
+import io
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime, timezone
+
+CSV_HEADER = "Date, CO2 ppm, Celsius, Humidity %, Pressure hPa\n"
+TAIL_CHUNK = 4096  # bytes, longer than any line
+INDEX_SUFFIX = ".idx"
+INDEX_INTERVAL = 64 * 1024  # bytes of CSV between index entries
+_INDEX_ENTRY = struct.Struct("<qq")  # time ns, offset
+
+
+def timestamp_ns(timestamp):
+    """Return nanoseconds since epoch, naive datetimes are taken as UTC
+    param: timestamp (datetime, str in ISO format or int nanoseconds)
+    """
+    if isinstance(timestamp, int):
+        return timestamp
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.strip())
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    seconds = calendar.timegm(timestamp.timetuple())
+    return seconds * 10**9 + timestamp.microsecond * 1000
+
+
+class CsvLogWriter:
+    """Append samples to a CSV log, the header is written to a new file
+    Has the same interface as binlog.BinLogWriter.
+
+    param:
+        path (str): log file
+        header (str): first line of a new file, an existing file must
+            have the same
+        index (bool): keep the sidecar index up to date
+    """
+
+    def __init__(self, path, header=CSV_HEADER, index=True):
+        self.path = path
+        if os.path.exists(path):
+            _truncate_torn_line(path)
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            with open(path, newline="") as f:
+                existing = f.readline()
+            if existing != header:
+                raise ValueError(f"{path}: header mismatch: {existing!r}")
+        # newline="" keeps the byte offsets of the index right on Windows
+        self.f = open(path, "a", newline="")
+        if new:
+            self.f.write(header)
+            self.f.flush()
+        self._offset = os.path.getsize(path)
+        self._index = None
+        if index:
+            # Catch up with rows written without the index
+            _, offsets = update_csv_index(path)
+            self._indexed = offsets[-1] if offsets else None
+            self._index = open(path + INDEX_SUFFIX, "ab")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, timestamp, values):
+        """Append one sample
+        param:
+            timestamp (datetime): written as is
+            values (sequence): in the order of the header after Date
+        """
+        line = ", ".join(str(v) for v in (timestamp, *values)) + "\n"
+        if self._index is not None and (
+            self._indexed is None or self._offset - self._indexed >= INDEX_INTERVAL
+        ):
+            entry = _INDEX_ENTRY.pack(timestamp_ns(timestamp), self._offset)
+            self._index.write(entry)
+            self._indexed = self._offset
+        self.f.write(line)
+        self._offset += len(line.encode())
+
+    def flush(self, sync=False):
+        """Flush the appended rows
+        param: sync (bool): also fsync() to make them durable
+        """
+        self.f.flush()
+        if sync:
+            os.fsync(self.f.fileno())
+        if self._index is not None:
+            # After the rows, so that the entries never point past the end
+            self._index.flush()
+
+    def close(self):
+        self.f.close()
+        if self._index is not None:
+            self._index.close()
+
+
+def _truncate_torn_line(path):
+    """Cut a last line without newline, written when the logger crashed"""
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(size - TAIL_CHUNK, 0))
+        tail = f.read()
+        if tail.endswith(b"\n"):
+            return
+        end = tail.rfind(b"\n")
+        if end < 0 and size > TAIL_CHUNK:
+            raise ValueError(f"{path}: last line is too long")
+        f.truncate(size - len(tail) + end + 1)
+
+
+def load_csv_index(path):
+    """Return the index of a CSV log as (times, offsets) lists
+    Entries beyond the end of the CSV are dropped. Both are empty if there
+    is no index, or if it is stale (the CSV was truncated or replaced),
+    which is found by checking the last entry against its row.
+    """
+    entries = array("q")
+    try:
+        with open(path + INDEX_SUFFIX, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return [], []
+    # Drop a torn entry
+    entries.frombytes(data[: len(data) // _INDEX_ENTRY.size * _INDEX_ENTRY.size])
+    if sys.byteorder == "big":
+        entries.byteswap()
+    times, offsets = list(entries[0::2]), list(entries[1::2])
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        count = bisect.bisect_left(offsets, size)
+        if count and not _is_row(f, times[count - 1], offsets[count - 1]):
+            return [], []
+    return times[:count], offsets[:count]
+
+
+def _is_row(f, time, offset):
+    """Return True if a row of the time starts at the offset of f"""
+    if offset <= 0:
+        return False
+    f.seek(offset - 1)
+    line = f.read(TAIL_CHUNK)
+    if not line.startswith(b"\n"):
+        return False
+    try:
+        return timestamp_ns(line[1:].split(b",", 1)[0].decode()) == time
+    except ValueError:
+        return False
+
+
+def update_csv_index(path):
+    """Index the rows of a CSV log after the last index entry
+    Builds the whole index of a CSV log written without one.
+    return: (times, offsets) lists of the updated index
+    """
+    times, offsets = load_csv_index(path)
+    with open(path, "rb") as f:
+        if offsets:
+            f.seek(offsets[-1])
+            offset = f.tell() + len(f.readline())
+            indexed = offsets[-1]
+        else:
+            offset = len(f.readline())  # header
+            indexed = None
+        entries = []
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            if indexed is None or offset - indexed >= INDEX_INTERVAL:
+                time = timestamp_ns(line.split(b",", 1)[0].decode())
+                entries.append((time, offset))
+                indexed = offset
+            offset += len(line)
+
+    with open(path + INDEX_SUFFIX, "ab") as f:
+        # Cut the entries dropped by load_csv_index()
+        f.truncate(len(offsets) * _INDEX_ENTRY.size)
+        for time, offset in entries:
+            f.write(_INDEX_ENTRY.pack(time, offset))
+            times.append(time)
+            offsets.append(offset)
+    return times, offsets
+
+
+def read_csv_log(path, start=None):
+    """Read a CSV log into a pandas.DataFrame
+    Column names are stripped of the space after the separator.
+    A torn last line (without newline) is dropped.
+
+    param:
+        path (str): log file
+        start (datetime or int): with an index, parsing starts at the last
+            indexed row before start, so a few earlier rows are included.
+            int is nanoseconds since epoch.
+    """
+    df, _ = CsvTailReader(path, start).read()
+    return df
+
+
+class CsvTailReader:
+    """Read a CSV log that is being appended to
+    Each read() parses only the rows appended since the last one.
+    The log is read again from the start if it was truncated or replaced
+    (rotated), which is detected by its size and inode.
+
+    param:
+        path (str): log file
+        start (datetime or int): the first read starts here, see read_csv_log()
+    """
+
+    def __init__(self, path, start=None):
+        self.path = path
+        self.start = None if start is None else timestamp_ns(start)
+        self._header = None
+        self._offset = 0
+        self._inode = None
+
+    def _first_offset(self):
+        if self.start is None:
+            return 0
+        times, offsets = load_csv_index(self.path)
+        i = bisect.bisect_right(times, self.start) - 1
+        if i < 0:
+            return 0
+        with open(self.path, "rb") as f:
+            if not _is_row(f, times[i], offsets[i]):
+                return 0  # stale index, read all
+        return offsets[i]
+
+    def read(self):
+        """Parse the rows appended since the last read
+        return: (pandas.DataFrame, reset) reset is True if the rows are
+            from the start of the log, i.e. on the first read or when the
+            log was truncated or replaced
+        """
+        import pandas as pd
+
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            reset = (
+                self._header is None
+                or stat.st_ino != self._inode
+                or stat.st_size < self._offset
+            )
+            if reset:
+                self._header = f.readline()
+                if not self._header.endswith(b"\n"):
+                    raise ValueError(f"{self.path}: no header")
+                self._offset = max(self._first_offset(), f.tell())
+                self._inode = stat.st_ino
+            f.seek(self._offset)
+            data = f.read()
+        # Leave a torn last line (being written) to the next read
+        data = data[: data.rfind(b"\n") + 1]
+        self._offset += len(data)
+        df = pd.read_csv(io.BytesIO(self._header + data), skipinitialspace=True)
+        return df, reset
@@ -13,19 +13,29 @@ from PIL import Image
 import os
 
 try:
-    from openweathermap.weather_data import weather_data
+    from openweathermap.weather_data import weather_data, FORECAST_SAVE_PATH
 except ImportError:
     openweathermap_available = False
 else:
     openweathermap_available = True
 
 from japan_meteological_agency import jma_data
+import binlog
+from csv_log import CsvTailReader, load_csv_index, read_csv_log
+import partitioned_log
+import sqlite_log
+from decimate import decimate_frame
 
 CSV_FILENAME = "./dump_data.csv"
+BINLOG_FILENAME = "./dump_data.bin"
+SQLITE_FILENAME = "./dump_data.sqlite3"
+LOG_DIR = "./dump_data"
 TIMEZONE = "Asia/Tokyo"
 CITY = "Tokyo.JP"
 CELSIUS_OFFSET = 2  # generated heat by the board
 DISPLAY_DAYS = 31
+DISPLAY_POINTS = 4000  # rows of sensor data sent to the browser
+FORECAST_MAX_AGE = 3 * 60 * 60  # sec, forecast traces are rebuilt after this
 
 external_stylesheets = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
 hour_width_in_msec = 1000 * 3600
@@ -38,13 +48,14 @@ def thin_out_data(df, days=7, rows=2000):
     param:
         df (pandas.DataFrame): include time data
         days (int): wanted data width
-        rows (int): wanted data rows
+        rows (int): wanted maximum data rows, decimated by LTTB so that
+            peaks are kept (decimate.py)
     return: (pandas.DataFrame)
     """
-    if days != 0:
+    if days != 0 and len(df) != 0:
         df = df[(df.index > df.index[-1] - timedelta(days=days))]
     if rows != 0:
-        df = df[:: len(df) // rows]
+        df = decimate_frame(df, rows)
 
     return df
 
@@ -204,15 +215,162 @@ def add_historical_fig(fig):
     return fig
 
 
-def add_sensor_csv_fig(fig, csv_file):
-    df = pd.read_csv(csv_file)
+def read_sensor_log(log_file, days=DISPLAY_DAYS):
+    """Read the sensor log of the last `days`
+
+    A binary log (.bin) is memory-mapped and only the displayed days are
+    converted. A CSV log is parsed from the displayed days on if it has an
+    index (dump_data.csv.idx), entirely otherwise. Of a partitioned log
+    directory only the partitions of the displayed days are read, of a
+    SQLite database the displayed days are queried, from a rollup if
+    there are more than sqlite_log.MAX_POINTS rows.
+
+    param:
+        log_file (str): dump_data.csv, dump_data.bin, dump_data.sqlite3 or
+            dump_data directory
+        days (int): wanted data width
+    return: (pandas.DataFrame) indexed by time in TIMEZONE
+    """
+    if os.path.isdir(log_file):
+        span = partitioned_log.time_span(log_file)
+        start = None
+        if days != 0 and span is not None:
+            start = span[1] - days * 24 * 3600 * 10**9
+        df = partitioned_log.read_range(log_file, start)
+        if days != 0 and len(df) != 0:
+            # The last partition may not be filled to its end
+            df = df[df.index > df.index[-1] - timedelta(days=days)]
+        df.index = df.index.tz_convert(TIMEZONE)
+        return df
+
+    if log_file.endswith(".sqlite3"):
+        start = None
+        if days != 0:
+            end = sqlite_log.last_time(log_file)
+            if end is not None:
+                start = end - days * 24 * 3600 * 10**9
+        # Long ranges come from the rollups with min/max envelopes
+        df = sqlite_log.read_summary(log_file, start)
+        df.index = df.index.tz_convert(TIMEZONE)
+        return df
+
+    if log_file.endswith(".bin"):
+        records = binlog.load(log_file)
+        start = None
+        if days != 0 and len(records) != 0:
+            start = int(records["time"][-1]) - days * 24 * 3600 * 10**9
+        df = binlog.to_dataframe(records, start)
+        df.index = df.index.tz_convert(TIMEZONE)
+        return df
+
+    df = read_csv_log(log_file, csv_start(log_file, days))
     df = set_timezoned_time_to_index(df)
-    df = thin_out_data(df, days=DISPLAY_DAYS, rows=0)
+    return thin_out_data(df, days=days, rows=0)
+
+
+def csv_start(csv_file, days):
+    """Return where to start reading the last `days` of a CSV log
+    return: (int) nanoseconds since epoch, None to read all
+    """
+    if days == 0:
+        return None
+    times, _ = load_csv_index(csv_file)
+    if not times:
+        return None
+    # The last indexed row is a little before the last row
+    return times[-1] - days * 24 * 3600 * 10**9
+
+
+class SensorLog:
+    """The displayed days of the sensor log, kept between updates
+
+    A CSV log is tailed, so an update parses only the appended rows.
+    The other logs are read again on each update.
+
+    param:
+        log_file (str): see read_sensor_log()
+        days (int): wanted data width
+    """
+
+    def __init__(self, log_file, days=DISPLAY_DAYS):
+        self.log_file = log_file
+        self.days = days
+        self.df = None
+        self.key = None  # source_key() of self.df
+        self._tail = None
+
+    def source_key(self):
+        """Return the sizes and mtimes of the log files, changed by a write"""
+        paths = [self.log_file]
+        if os.path.isdir(self.log_file):
+            manifest = partitioned_log.load_manifest(self.log_file)
+            paths.append(os.path.join(self.log_file, partitioned_log.MANIFEST))
+            if manifest["partitions"]:
+                last = manifest["partitions"][-1]["file"]
+                paths.append(os.path.join(self.log_file, last))
+        elif self.log_file.endswith(".sqlite3"):
+            paths.append(self.log_file + "-wal")
+        key = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                key.append(None)
+            else:
+                key.append((stat.st_size, stat.st_mtime_ns))
+        return tuple(key)
+
+    def update(self):
+        """Read the new data into self.df, nothing if the log is unchanged
+        return: (bool) True if self.df was replaced, False if rows were
+            only appended to it
+        """
+        key = self.source_key()
+        if key == self.key:
+            return False
+        self.key = key
+        if not os.path.exists(self.log_file):
+            self.df = None
+            self._tail = None
+            return True
+        if not self.log_file.endswith(".csv"):
+            self.df = read_sensor_log(self.log_file, self.days)
+            return True
+
+        if self._tail is None:
+            start = csv_start(self.log_file, self.days)
+            self._tail = CsvTailReader(self.log_file, start)
+        df, reset = self._tail.read()
+        df = set_timezoned_time_to_index(df)
+        if not reset:
+            df = pd.concat([self.df, df])
+        self.df = thin_out_data(df, days=self.days, rows=0)
+        return reset
+
+    def window(self, start=None, end=None):
+        """Return start <= time <= end at a resolution for DISPLAY_POINTS
+        The SQLite log is queried again, so zooming into a range drawn
+        from a rollup shows the samples. The other logs are sliced from
+        self.df, which has all their rows of the displayed days.
+
+        param: start, end (pandas.Timestamp): None is the displayed days
+        """
+        if start is not None and self.log_file.endswith(".sqlite3"):
+            df = sqlite_log.read_summary(
+                self.log_file, start, end, max_points=DISPLAY_POINTS
+            )
+            df.index = df.index.tz_convert(TIMEZONE)
+        else:
+            df = self.df.loc[start:end]
+        return thin_out_data(df, days=0, rows=DISPLAY_POINTS)
+
+
+def add_sensor_csv_fig(fig, df):
 
     fig.add_trace(
         go.Scatter(
             x=df.index,
-            y=df[" Pressure hPa"],
+            y=df["Pressure hPa"],
             name="Pressure hPa",
             yaxis="y1",
             line=dict(color=px.colors.qualitative.Plotly[1 - 1]),
@@ -221,7 +379,7 @@ def add_sensor_csv_fig(fig, csv_file):
     fig.add_trace(
         go.Scatter(
             x=df.index,
-            y=df[" CO2 ppm"],
+            y=df["CO2 ppm"],
             name="CO2 ppm",
             yaxis="y2",
             line=dict(color=px.colors.qualitative.Plotly[2 - 1]),
@@ -230,7 +388,7 @@ def add_sensor_csv_fig(fig, csv_file):
     fig.add_trace(
         go.Scatter(
             x=df.index,
-            y=df[" Humidity %"],
+            y=df["Humidity %"],
             name="Humidity %",
             yaxis="y3",
             line=dict(color=px.colors.qualitative.Plotly[3 - 1]),
@@ -239,37 +397,216 @@ def add_sensor_csv_fig(fig, csv_file):
     fig.add_trace(
         go.Scatter(
             x=df.index,
-            y=df[" Celsius"] - CELSIUS_OFFSET,
+            y=df["Celsius"] - CELSIUS_OFFSET,
             name="Celsius",
             yaxis="y4",
             line=dict(color=px.colors.qualitative.Plotly[4 - 1]),
         )
     )
+    add_envelope_fig(fig, df)
 
     return df
 
 
+def add_envelope_fig(fig, df):
+    """Add min/max bands of rolled up data (sqlite_log.read_summary())
+    They keep the spikes the means smooth out. Added after the sensor
+    traces so that extend_sensor_fig() finds those at the same indices.
+    """
+    columns = [
+        ("Pressure hPa", "y1", 0),
+        ("CO2 ppm", "y2", 0),
+        ("Humidity %", "y3", 0),
+        ("Celsius", "y4", CELSIUS_OFFSET),
+    ]
+    for i, (column, yaxis, offset) in enumerate(columns):
+        if f"{column} max" not in df:
+            continue
+        color = px.colors.qualitative.Plotly[i]
+        for bound, fill in (("min", "none"), ("max", "tonexty")):
+            fig.add_trace(
+                go.Scatter(
+                    x=df.index,
+                    y=df[f"{column} {bound}"] - offset,
+                    name=f"{column} {bound}",
+                    yaxis=yaxis,
+                    line=dict(color=color, width=0),
+                    fill=fill,
+                    opacity=0.3,
+                    mode="lines",
+                    showlegend=False,
+                )
+            )
+
+
+def extend_sensor_fig(df, envelope):
+    """Return extendData appending df to the traces of add_sensor_csv_fig()
+    The traces are trimmed to the last DISPLAY_POINTS points, so df is
+    to be decimated to the resolution of the figure (thin_new_rows()).
+
+    param: envelope (bool): the figure has the traces of add_envelope_fig()
+    return: (data, trace indices, max points) for dcc.Graph.extendData
+    """
+    x = df.index.tolist()
+    columns = [
+        ("Pressure hPa", 0),
+        ("CO2 ppm", 0),
+        ("Humidity %", 0),
+        ("Celsius", CELSIUS_OFFSET),
+    ]
+    ys = [(df[column] - offset).tolist() for column, offset in columns]
+    if envelope:
+        # In the order of add_envelope_fig()
+        for column, offset in columns:
+            if f"{column} max" not in df:
+                continue
+            for bound in ("min", "max"):
+                ys.append((df[f"{column} {bound}"] - offset).tolist())
+    data = dict(x=[x] * len(ys), y=ys)
+    return data, list(range(len(ys))), DISPLAY_POINTS
+
+
+def thin_new_rows(df, new_rows):
+    """Decimate the new rows of df as the figure of create_fig() is
+    param:
+        df (pandas.DataFrame): the displayed rows, new_rows included
+        new_rows (pandas.DataFrame): the rows after the figure
+    """
+    if len(df) <= DISPLAY_POINTS:
+        return new_rows
+    rows = -(-len(new_rows) * DISPLAY_POINTS // len(df))  # ceil
+    return thin_out_data(new_rows, days=0, rows=max(rows, 3))
+
+
+def replace_sensor_fig(df, envelope):
+    """Return a dash.Patch replacing the sensor data of the figure with df
+    param: envelope (bool): the figure has the traces of add_envelope_fig()
+    """
+    patch = dash.Patch()
+    x = df.index.tolist()
+    columns = [
+        ("Pressure hPa", 0),
+        ("CO2 ppm", 0),
+        ("Humidity %", 0),
+        ("Celsius", CELSIUS_OFFSET),
+    ]
+    for i, (column, offset) in enumerate(columns):
+        patch["data"][i]["x"] = x
+        patch["data"][i]["y"] = (df[column] - offset).tolist()
+    if not envelope:
+        return patch
+
+    i = len(columns)
+    for column, offset in columns:
+        for bound in ("min", "max"):
+            if f"{column} max" in df:
+                patch["data"][i]["x"] = x
+                patch["data"][i]["y"] = (df[f"{column} {bound}"] - offset).tolist()
+            else:
+                # Samples have no envelope
+                patch["data"][i]["x"] = []
+                patch["data"][i]["y"] = []
+            i += 1
+    return patch
+
+
+def relayout_range(relayout):
+    """Return the x-axis range of a graph relayout event
+    return: (start, end) pandas.Timestamp in TIMEZONE, (None, None) if
+        the x-axis is reset, None if it is not changed
+    """
+    if not relayout:
+        return None
+    if relayout.get("xaxis.autorange"):
+        return None, None
+    if "xaxis.range[0]" in relayout:
+        bounds = relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+    elif "xaxis.range" in relayout:
+        bounds = relayout["xaxis.range"]
+    else:
+        return None
+    # Plotly gives the wall time of the axis without timezone
+    bounds = [pd.Timestamp(bound) for bound in bounds]
+    return tuple(
+        b.tz_localize(TIMEZONE) if b.tzinfo is None else b.tz_convert(TIMEZONE)
+        for b in bounds
+    )
+
+
+def forecast_key():
+    """Return the age class of the saved forecast, changed every FORECAST_MAX_AGE"""
+    try:
+        mtime = os.path.getmtime(FORECAST_SAVE_PATH)
+    except FileNotFoundError:
+        mtime = None
+    return mtime, int(datetime.now().timestamp() // FORECAST_MAX_AGE)
+
+
+def historical_key():
+    """Return the JMA fetch window, the 3 hour files of yesterday and today"""
+    now_jst = datetime.now(timezone.utc) + timedelta(hours=+9)
+    return now_jst.date(), -(-now_jst.hour // 3)
+
+
+def cached_group(name, key, build):
+    """Return a figure of one group of traces, built again if key changed
+    param: build (callable): adds the traces to the go.Figure it is given
+    """
+    cached = trace_groups.get(name)
+    if cached is None or cached[0] != key:
+        group = go.Figure()
+        build(group)
+        cached = (key, group)
+        trace_groups[name] = cached
+    return cached[1]
+
+
+# Trace groups and the whole figure, (key, go.Figure) by name
+trace_groups = {}
+
+
 # assume you have a "long-form" data frame
 # see https://plotly.com/python/px-arguments/ for more options
-def create_fig(csv_file):
-    fig = go.Figure()
-    df = None
-
-    if os.path.exists(csv_file):
-        df = add_sensor_csv_fig(fig, csv_file)
-        latest = pd.to_datetime(df.index[-1], utc=True)
+def create_fig(sensor_log):
+    """Assemble the figure from the cached trace groups
+    The sensor traces are keyed on the log files, the forecast on the age
+    of its file and the history on the JMA fetch window. The figure is
+    returned as is if none of them changed.
+    """
+    df = sensor_log.df
+    groups = []
+    if df is not None and len(df) != 0:
+        groups.append(
+            (
+                "sensor",
+                sensor_log.key,
+                lambda f: add_sensor_csv_fig(
+                    f, thin_out_data(df, days=0, rows=DISPLAY_POINTS)
+                ),
+            )
+        )
     else:
-        print(f"Warning! {csv_file} is not found.")
-        latest = datetime.now(timezone.utc)
+        print(f"Warning! {sensor_log.log_file} is not found.")
 
     if openweathermap_available:
-        fig = add_forecast_fig(fig)
-        offset = timedelta(days=1)
-    else:
-        offset = timedelta(days=0)
+        groups.append(("forecast", forecast_key(), add_forecast_fig))
 
     if TIMEZONE == "Asia/Tokyo":
-        fig = add_historical_fig(fig)
+        groups.append(("historical", historical_key(), add_historical_fig))
+
+    key = tuple((name, key) for name, key, _ in groups)
+    cached = trace_groups.get("figure")
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    fig = go.Figure()
+    for name, group_key, build in groups:
+        group = cached_group(name, group_key, build)
+        fig.add_traces(group.data)
+        for image in group.layout.images:
+            fig.add_layout_image(image)
+        for annotation in group.layout.annotations:
+            fig.add_annotation(annotation)
 
     fig.update_layout(
         legend=dict(
@@ -315,10 +652,23 @@ def create_fig(csv_file):
     )
     # "plotly", "plotly_white", "plotly_dark", "ggplot2", "seaborn", "simple_white", "none"
     fig.update_layout(template="plotly_white")
+    trace_groups["figure"] = (key, fig)
     return fig
 
 
-fig = create_fig(CSV_FILENAME)
+# The partitioned, SQLite or binary log is used if save_csv.py writes it.
+if os.path.exists(os.path.join(LOG_DIR, partitioned_log.MANIFEST)):
+    SENSOR_LOG = LOG_DIR
+elif os.path.exists(SQLITE_FILENAME):
+    SENSOR_LOG = SQLITE_FILENAME
+elif os.path.exists(BINLOG_FILENAME):
+    SENSOR_LOG = BINLOG_FILENAME
+else:
+    SENSOR_LOG = CSV_FILENAME
+
+sensor_log = SensorLog(SENSOR_LOG)
+sensor_log.update()
+fig = create_fig(sensor_log)
 
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 app.layout = html.Div(
@@ -336,6 +686,10 @@ app.layout = html.Div(
             figure=fig,
             responsive="auto",
         ),
+        # Time of the last sensor row in the figure of this page
+        dcc.Store(id="sensor-end"),
+        # Zoomed x-axis range of this page, [start, end] ISO strings
+        dcc.Store(id="x-range"),
     ],
     style={
         "textAlign": "center",
@@ -344,13 +698,59 @@ app.layout = html.Div(
 
 
 @app.callback(
-    dash.dependencies.Output("graph", "figure"),
-    [dash.dependencies.Input("update-button", "n_clicks")],
+    [
+        dash.dependencies.Output("graph", "figure"),
+        dash.dependencies.Output("graph", "extendData"),
+        dash.dependencies.Output("sensor-end", "data"),
+        dash.dependencies.Output("x-range", "data"),
+    ],
+    [
+        dash.dependencies.Input("update-button", "n_clicks"),
+        dash.dependencies.Input("graph", "relayoutData"),
+    ],
+    [
+        dash.dependencies.State("sensor-end", "data"),
+        dash.dependencies.State("x-range", "data"),
+    ],
 )
-def update_csv(n_clicks):
+def update_csv(n_clicks, relayout, sensor_end, zoomed):
+    """Rebuild the figure on page load, else extend its sensor traces
+    Zooming replaces the sensor traces with the data of the visible range,
+    while zoomed an update replaces them again instead of extending them.
+    """
     global fig
-    fig = create_fig(CSV_FILENAME)
-    return fig
+    no_update = dash.no_update
+    if dash.ctx.triggered_id == "graph":
+        x_range = relayout_range(relayout)
+        df = sensor_log.df
+        if x_range is None or df is None or len(df) == 0:
+            return no_update, no_update, no_update, no_update
+        envelope = "CO2 ppm max" in df
+        patch = replace_sensor_fig(sensor_log.window(*x_range), envelope)
+        if x_range[0] is None:
+            return patch, no_update, no_update, None
+        return patch, no_update, no_update, [b.isoformat() for b in x_range]
+
+    replaced = sensor_log.update()
+    df = sensor_log.df
+    if df is None or len(df) == 0:
+        fig = create_fig(sensor_log)
+        return fig, no_update, None, None
+    end = df.index[-1].isoformat()
+    if replaced or n_clicks == 0 or sensor_end is None:
+        fig = create_fig(sensor_log)
+        return fig, no_update, end, None
+
+    new_rows = df[df.index > pd.Timestamp(sensor_end)]
+    if len(new_rows) == 0:
+        return no_update, no_update, no_update, no_update
+    envelope = "CO2 ppm max" in df
+    if zoomed:
+        x_range = [pd.Timestamp(b) for b in zoomed]
+        patch = replace_sensor_fig(sensor_log.window(*x_range), envelope)
+        return patch, no_update, end, no_update
+    extend = extend_sensor_fig(thin_new_rows(df, new_rows), envelope)
+    return no_update, extend, end, no_update
 
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""Shape-preserving decimation of sensor series for plotting
+
+Both methods return the indices of the kept points, so the caller can
+take the rows of any number of columns:
+
+    lttb_indices(x, y, points)  Largest-Triangle-Three-Buckets, keeps the
+                                points that shape the line most
+    minmax_indices(y, points)   minimum and maximum of each bucket, keeps
+                                every peak (e.g. short CO2 spikes)
+
+decimate_frame() applies one of them to each column of a DataFrame on
+its shared time index and returns at most `points` rows, unless that is
+fewer than the minimum of the method (3 or 4) for each column.
+
+require: pip install numpy (pandas for decimate_frame)
+"""
+
+import numpy as np
+
+LTTB = "lttb"
+MINMAX = "minmax"
+
+
+def _bucket_edges(n, buckets):
+    """Return buckets + 1 edges splitting range(1, n - 1) evenly"""
+    return np.linspace(1, n - 1, buckets + 1).astype(np.int64)
+
+
+def lttb_indices(x, y, points):
+    """Return the indices of `points` points of (x, y) chosen by LTTB
+    The first and the last points are always kept. Each bucket keeps the
+    point forming the largest triangle with the point kept in the previous
+    bucket and the mean of the next bucket.
+
+    param:
+        x (array): increasing, e.g. int64 nanoseconds
+        y (array): values, NaN is not allowed
+        points (int): number of output points, at least 3
+    return: (numpy.ndarray of int64) increasing indices
+    """
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    if points < 3:
+        raise ValueError(f"points must be 3 or more: {points}")
+    # Relative to the first point, float64 keeps ns precision for years
+    x = np.asarray(x, dtype=np.int64) - int(x[0])
+    x = x.astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = _bucket_edges(n, points - 2)
+    # Means of every bucket, the last point is the "next bucket" of the last
+    counts = np.diff(edges)
+    x_mean = np.append(np.add.reduceat(x, edges[:-1]) / counts, x[-1])
+    y_mean = np.append(np.add.reduceat(y, edges[:-1]) / counts, y[-1])
+
+    indices = np.empty(points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        cx, cy = x_mean[i + 1], y_mean[i + 1]
+        # Twice the triangle areas, the factor does not change the argmax
+        area = np.abs((ax - cx) * (y[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_indices(y, points):
+    """Return the indices of the minimum and maximum of each bucket
+    There are at most (points - 2) // 2 buckets of equal size, so with the
+    first and the last point the result has at most `points` indices.
+    NaN values are ignored.
+
+    return: (numpy.ndarray of int64) increasing indices
+    """
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    if points < 4:
+        raise ValueError(f"points must be 4 or more: {points}")
+    y = np.asarray(y, dtype=np.float64)
+    size = -(-n // ((points - 2) // 2))  # ceil
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+
+    nan = np.isnan(padded)
+    lows = np.argmin(np.where(nan, np.inf, padded), axis=1)
+    highs = np.argmax(np.where(nan, -np.inf, padded), axis=1)
+    base = np.arange(buckets) * size
+    indices = np.concatenate([base + lows, base + highs, [0, n - 1]])
+    return np.unique(np.minimum(indices, n - 1))
+
+
+def decimate_frame(df, points, method=LTTB):
+    """Return at most `points` rows of df, keeping the shape of each column
+    The point budget is shared by the columns, the kept rows are the union
+    of the rows chosen for each column over the time index.
+
+    param:
+        df (pandas.DataFrame): indexed by increasing time
+        points (int): maximum number of rows
+        method (str): LTTB or MINMAX
+    """
+    if len(df) <= points:
+        return df
+    minimum = 4 if method == MINMAX else 3
+    per_column = max(points // max(len(df.columns), 1), minimum)
+    x = df.index.asi8 if hasattr(df.index, "asi8") else np.arange(len(df))
+    keep = []
+    for column in df.columns:
+        y = df[column].to_numpy(dtype=np.float64)
+        if method == MINMAX:
+            keep.append(minmax_indices(y, per_column))
+        elif method == LTTB:
+            valid = np.flatnonzero(~np.isnan(y))
+            if len(valid) < 3:
+                keep.append(valid)
+                continue
+            keep.append(valid[lttb_indices(x[valid], y[valid], per_column)])
+        else:
+            raise ValueError(f"Unknown method: {method}")
+    return df.iloc[np.unique(np.concatenate(keep))]
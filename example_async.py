@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import asyncio
+from bme280 import BME280
+from ccs811 import CCS811
+
+
+async def main():
+    ccs811 = CCS811()
+    bme280 = BME280()
+    p, t, h = await bme280.get_async()
+    ccs811.compensate(h, t)
+
+    while True:
+        try:
+            # Both sensors are read in parallel, the loop stays responsive.
+            (p, t, h), (voc, co2), _ = await asyncio.gather(
+                bme280.get_async(), ccs811.get_async(), asyncio.sleep(1)
+            )
+            print(
+                f"{p:7.2f} hPa, {t:6.2f} C, {h:5.2f} %, TVOC:{voc:4d} ppb, eCO2:{co2:4d} ppm"
+            )
+        except OSError:
+            # i2c bus somtimes cannot access
+            await asyncio.sleep(1)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -4,12 +4,20 @@ import dash
 from dash import dcc
 from dash import html
 import plotly.express as px
-import pandas as pd
 
 from bme280 import BME280
 from ccs811 import CCS811
+from ring_buffer import RingBuffer
 from datetime import datetime
+from time import sleep
 import os
+import threading
+
+FIELDS = ["CO2 ppm", "Celsius", "Humidity %", "Pressure hPa"]
+INTERVAL = 1  # sec
+# Kept on the server and in the browser, new points are sent with
+# extendData so a tick costs the same after days.
+MAX_POINTS = 24 * 60 * 60  # 1 day of 1 sec interval
 
 ccs811 = CCS811()
 bme280 = BME280()
@@ -23,54 +31,92 @@ app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 p, t, h = bme280.get()
 ccs811.compensate(h, t)
 voc, co2 = ccs811.get()
-df = pd.DataFrame(
-    [[co2, t, h, p]],
-    columns=["CO2 ppm", "Celsius", "Humidity %", "Pressure hPa"],
-    index=[datetime.now()],
-)
-fig = px.line(df)
-
-app.layout = html.Div(
-    children=[
-        html.H1(
-            children="I2C Sensor on Dash",
-            style={
-                "textAlign": "center",
-            },
-        ),
-        html.Div(
-            children="Dash: A web application framework for Python.",
-            style={
-                "textAlign": "center",
-            },
-        ),
-        dcc.Graph(
-            id="graph",
-            figure=fig,
-            responsive="auto",
-        ),
-        dcc.Interval(id="interval-component", interval=1 * 1000, n_intervals=1),
-    ]
-)
+samples = RingBuffer(MAX_POINTS, FIELDS)
+samples.append(datetime.now(), [co2, t, h, p])
+
+
+def last_time():
+    """Return the time (ns) of the latest sample"""
+    return int(samples.last(1)["time"][0].astype("int64"))
+
+
+def serve_layout():
+    """Layout of a new page, the figure has the samples so far"""
+    fig = px.line(samples.to_dataframe())
+    return html.Div(
+        children=[
+            html.H1(
+                children="I2C Sensor on Dash",
+                style={
+                    "textAlign": "center",
+                },
+            ),
+            html.Div(
+                children="Dash: A web application framework for Python.",
+                style={
+                    "textAlign": "center",
+                },
+            ),
+            dcc.Graph(
+                id="graph",
+                figure=fig,
+                responsive="auto",
+            ),
+            # Time (ns) of the last sample in the graph of this page
+            dcc.Store(id="last-sample", data=last_time()),
+            dcc.Interval(
+                id="interval-component", interval=INTERVAL * 1000, n_intervals=1
+            ),
+        ]
+    )
+
+
+app.layout = serve_layout
+
+
+def acquire():
+    """Append a sample every INTERVAL (thread)
+    The only writer of samples, the callbacks of the open pages only
+    read them.
+    """
+    while True:
+        sleep(INTERVAL)
+        try:
+            p, t, h = bme280.get()
+            voc, co2 = ccs811.get()
+        except OSError:
+            # No update
+            continue
+        samples.append(datetime.now(), [co2, t, h, p])  # Add row
+
+
+threading.Thread(target=acquire, daemon=True).start()
 
 
 @app.callback(
-    dash.dependencies.Output("graph", "figure"),
+    [
+        dash.dependencies.Output("graph", "extendData"),
+        dash.dependencies.Output("last-sample", "data"),
+    ],
     [dash.dependencies.Input("interval-component", "n_intervals")],
+    [dash.dependencies.State("last-sample", "data")],
 )
-def update(n_intervals):
-    global df
-    try:
-        p, t, h = bme280.get()
-        voc, co2 = ccs811.get()
-        df.loc[datetime.now()] = [co2, t, h, p]  # Add row
-    except OSError:
-        # No update
-        pass
-
-    fig = px.line(df)
-    return fig
+def update(n_intervals, last_sample):
+    """Send the samples after the last one of the page"""
+    new = samples.window(start=last_sample + 1)
+    if len(new["time"]) == 0:
+        return dash.no_update, dash.no_update
+    x = new["time"].astype("datetime64[us]").tolist()
+    data = dict(
+        x=[x] * len(FIELDS),
+        y=[new[field].tolist() for field in FIELDS],
+    )
+    last_sample = int(new["time"][-1].astype("int64"))
+    # Traces of px.line() are in the order of the columns
+    return (data, list(range(len(FIELDS))), MAX_POINTS), last_sample
 
 
 if __name__ == "__main__":
-    app.run_server(debug=True, host=os.uname()[1], port="5001")
+    # The reloader runs this module in a second process, which would
+    # read the sensors as well and take the CCS811 results of this one.
+    app.run_server(debug=True, use_reloader=False, host=os.uname()[1], port="5001")
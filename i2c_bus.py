@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2020 H.Saido <saido.nv@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from threading import Lock, RLock
+
+from smbus2 import SMBus
+
+
+class I2CBus:
+    """Shared, thread-safe I2C bus
+
+    smbus2 selects the slave address with an ioctl before each transfer,
+    so unsynchronized use of one bus from several threads can talk to the
+    wrong device. Every transaction here holds `lock`, and a driver can
+    hold it around a multi-step sequence to make it one critical section:
+
+        with bus.lock:
+            bus.write_byte_data(addr, reg, value)
+            data = bus.read_i2c_block_data(addr, reg, length)
+
+    I2CBus.open() returns one shared instance (one file descriptor) per
+    bus number. Each open() needs a close(), the device is closed with
+    the last one.
+
+    param:
+        bus_num (int): i2c bus number
+        smbus_factory (callable): returns an SMBus like object for bus_num
+    """
+
+    _buses = {}
+    _buses_lock = Lock()
+
+    def __init__(self, bus_num=1, smbus_factory=SMBus):
+        self.bus_num = bus_num
+        self.lock = RLock()
+        self._smbus_factory = smbus_factory
+        self.smbus = smbus_factory(bus_num)
+        self._refs = 1
+
+    @classmethod
+    def open(cls, bus_num=1):
+        """Return the shared bus of bus_num"""
+        with cls._buses_lock:
+            bus = cls._buses.get(bus_num)
+            if bus is None:
+                bus = cls(bus_num)
+                cls._buses[bus_num] = bus
+            else:
+                bus._refs += 1
+            return bus
+
+    def close(self):
+        """Release one reference, close the device with the last one"""
+        with self._buses_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            if self._buses.get(self.bus_num) is self:
+                del self._buses[self.bus_num]
+        with self.lock:
+            self.smbus.close()
+
+    def reopen(self):
+        """Close and open the device again, to recover from bus errors
+        The other drivers on the bus keep using this instance.
+        """
+        with self.lock:
+            try:
+                self.smbus.close()
+            except OSError:
+                pass
+            self.smbus = self._smbus_factory(self.bus_num)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read_byte_data(self, i2c_addr, register):
+        with self.lock:
+            return self.smbus.read_byte_data(i2c_addr, register)
+
+    def write_byte_data(self, i2c_addr, register, value):
+        with self.lock:
+            self.smbus.write_byte_data(i2c_addr, register, value)
+
+    def read_i2c_block_data(self, i2c_addr, register, length):
+        with self.lock:
+            return self.smbus.read_i2c_block_data(i2c_addr, register, length)
+
+    def write_i2c_block_data(self, i2c_addr, register, data):
+        with self.lock:
+            self.smbus.write_i2c_block_data(i2c_addr, register, data)
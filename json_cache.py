@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""Small JSON files that persist sensor state between processes
+
+Used by the drivers to keep calibration and baseline values on disk.
+Writes are atomic (temporary file + rename), so a reader never sees
+a half written file even if several processes share the cache.
+"""
+
+import json
+import os
+import tempfile
+
+
+def load_json(path):
+    """Return the JSON object stored in path
+    Return an empty dict if the file is missing or broken.
+    """
+    path = os.path.expanduser(path)
+    try:
+        with open(path) as f:
+            obj = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(obj, dict):
+        return {}
+    return obj
+
+
+def save_json(path, obj):
+    """Atomically replace path with obj serialized as JSON"""
+    path = os.path.expanduser(path)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(obj, f, indent=4)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""Buffered group-commit writer for the sensor logs
+
+Rows are kept in memory and written to the log as one batch when
+COMMIT_ROWS rows are buffered or the oldest row is COMMIT_DELAY old.
+One commit is one write (and at most one fsync), instead of a flush
+per row. The delay is checked on append, so call commit() or close()
+to write the remaining rows.
+
+fsync policy:
+    FSYNC_NONE      leave write-back to the OS
+    FSYNC_BATCH     fsync every commit
+    FSYNC_INTERVAL  fsync a commit if the last fsync is fsync_interval old
+"""
+
+from time import monotonic
+
+FSYNC_NONE = "none"
+FSYNC_BATCH = "batch"
+FSYNC_INTERVAL = "interval"
+
+COMMIT_ROWS = 64
+COMMIT_DELAY = 60.0  # sec
+FSYNC_INTERVAL_SEC = 10 * 60.0
+
+
+class GroupCommitWriter:
+    """Batch rows for a log writer (csv_log.CsvLogWriter, binlog.BinLogWriter)
+
+    param:
+        log: writer with append(timestamp, values), flush(sync) and close()
+        rows (int): commit when this many rows are buffered
+        delay (float): commit when the oldest buffered row is this old (sec)
+        fsync (str): FSYNC_NONE, FSYNC_BATCH or FSYNC_INTERVAL
+        fsync_interval (float): minimum time between fsyncs (sec)
+    """
+
+    def __init__(
+        self,
+        log,
+        rows=COMMIT_ROWS,
+        delay=COMMIT_DELAY,
+        fsync=FSYNC_NONE,
+        fsync_interval=FSYNC_INTERVAL_SEC,
+    ):
+        if fsync not in (FSYNC_NONE, FSYNC_BATCH, FSYNC_INTERVAL):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.log = log
+        self.rows = rows
+        self.delay = delay
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.commits = 0
+        self.syncs = 0
+        self._buffer = []
+        self._oldest = None
+        self._last_sync = monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, timestamp, values):
+        """Buffer one row, commit if a threshold is reached"""
+        if not self._buffer:
+            self._oldest = monotonic()
+        self._buffer.append((timestamp, values))
+        if len(self._buffer) >= self.rows or monotonic() - self._oldest >= self.delay:
+            self.commit()
+
+    def commit(self):
+        """Write the buffered rows and apply the fsync policy"""
+        if not self._buffer:
+            return
+        for timestamp, values in self._buffer:
+            self.log.append(timestamp, values)
+        self._buffer = []
+
+        now = monotonic()
+        if self.fsync == FSYNC_INTERVAL:
+            sync = now - self._last_sync >= self.fsync_interval
+        else:
+            sync = self.fsync == FSYNC_BATCH
+        self.log.flush(sync=sync)
+        self.commits += 1
+        if sync:
+            self.syncs += 1
+            self._last_sync = now
+
+    def flush(self, sync=False):
+        """Commit now, sync forces an fsync"""
+        self.commit()
+        if sync:
+            self.log.flush(sync=True)
+
+    def close(self):
+        self.commit()
+        self.log.close()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+"""Time-partitioned sensor logs
+
+Samples are written to one file per period (a UTC day by default) in a
+directory, with a manifest of the partitions and their time bounds:
+
+    dump_data/
+        manifest.json
+        20240101.bin
+        20240102.bin
+
+Readers take a time range and open only the partitions overlapping it,
+so the load time depends on the range, not on the total history.
+
+require: pip install numpy pandas
+"""
+
+import os
+from datetime import datetime, timezone
+
+import binlog
+from csv_log import CsvLogWriter, read_csv_log
+from json_cache import load_json, save_json
+from ring_buffer import to_ns
+
+MANIFEST = "manifest.json"
+DAY = 24 * 60 * 60  # sec
+FORMATS = {"binlog": ".bin", "csv": ".csv"}
+
+
+def _manifest_path(directory):
+    return os.path.join(directory, MANIFEST)
+
+
+def load_manifest(directory):
+    """Return the manifest of directory, an empty one if there is none"""
+    manifest = load_json(_manifest_path(directory))
+    manifest.setdefault("partitions", [])
+    return manifest
+
+
+class PartitionedLogWriter:
+    """Append samples to time-partitioned log files
+    Has the same interface as binlog.BinLogWriter.
+
+    param:
+        directory (str): directory of the partitions and the manifest
+        fmt (str): "binlog" or "csv" partitions
+        period (int): partition length in seconds, UTC aligned
+    An existing directory must have the same fmt and period, the
+    partitions could not be found otherwise.
+    """
+
+    def __init__(self, directory, fmt="binlog", period=DAY):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format: {fmt}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.manifest = load_manifest(directory)
+        for key, value in (("format", fmt), ("period", period)):
+            existing = self.manifest.setdefault(key, value)
+            if existing != value:
+                raise ValueError(f"{directory}: {key} is {existing}, not {value}")
+        self.fmt = fmt
+        self.period = period
+        self._period_ns = self.period * 10**9
+        self._index = None
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _name(self, start_ns):
+        start = datetime.fromtimestamp(start_ns / 10**9, timezone.utc)
+        if self.period % DAY == 0:
+            return f"{start:%Y%m%d}{FORMATS[self.fmt]}"
+        return f"{start:%Y%m%dT%H%M}{FORMATS[self.fmt]}"
+
+    def _open(self, index):
+        """Switch to the partition of index, add it to the manifest if new"""
+        if self._writer is not None:
+            # The rows of the previous partition are complete
+            self._writer.flush(sync=True)
+            self._writer.close()
+        start = index * self._period_ns
+        name = self._name(start)
+        partitions = self.manifest["partitions"]
+        if not any(p["file"] == name for p in partitions):
+            end = start + self._period_ns
+            partitions.append(dict(file=name, start=start, end=end))
+            partitions.sort(key=lambda p: p["start"])
+            save_json(_manifest_path(self.directory), self.manifest)
+
+        path = os.path.join(self.directory, name)
+        if self.fmt == "binlog":
+            self._writer = binlog.BinLogWriter(path)
+        else:
+            self._writer = CsvLogWriter(path)
+        self._index = index
+
+    def append(self, timestamp, values):
+        """Append one sample to the partition of timestamp"""
+        index = to_ns(timestamp) // self._period_ns
+        if index != self._index:
+            self._open(index)
+        self._writer.append(timestamp, values)
+
+    def flush(self, sync=False):
+        if self._writer is not None:
+            self._writer.flush(sync=sync)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._index = None
+
+
+def partitions_in_range(directory, start=None, end=None):
+    """Return the manifest entries overlapping start <= time < end"""
+    start = None if start is None else to_ns(start)
+    end = None if end is None else to_ns(end)
+    return [
+        p
+        for p in load_manifest(directory)["partitions"]
+        if (start is None or p["end"] > start) and (end is None or p["start"] < end)
+    ]
+
+
+def time_span(directory):
+    """Return (start, end) ns of all partitions, None if there are none"""
+    partitions = load_manifest(directory)["partitions"]
+    if not partitions:
+        return None
+    return partitions[0]["start"], partitions[-1]["end"]
+
+
+def read_range(directory, start=None, end=None):
+    """Read samples with start <= time < end into a pandas.DataFrame
+    Only the partitions overlapping the range are opened.
+    return: columns named as in dump_data.csv, indexed by UTC "Date"
+    """
+    import numpy as np
+    import pandas as pd
+
+    frames = []
+    for partition in partitions_in_range(directory, start, end):
+        path = os.path.join(directory, partition["file"])
+        if not os.path.exists(path):
+            continue
+        if path.endswith(FORMATS["binlog"]):
+            df = binlog.to_dataframe(binlog.load(path))
+        else:
+            df = read_csv_log(path).set_index("Date")
+            df.index = pd.to_datetime(df.index).tz_localize("UTC")
+        frames.append(df)
+
+    if not frames:
+        return binlog.to_dataframe(np.empty(0, dtype=binlog.SENSOR_DTYPE))
+    df = pd.concat(frames)
+    if start is not None:
+        df = df[df.index >= pd.Timestamp(to_ns(start), tz="UTC")]
+    if end is not None:
+        df = df[df.index < pd.Timestamp(to_ns(end), tz="UTC")]
+    return df
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""Fixed capacity in-memory store of timestamped sensor samples
+
+require: pip install numpy
+"""
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+def to_ns(timestamp):
+    """Return nanoseconds since epoch (int)
+    Naive datetimes are taken as UTC, like the CSV logs.
+    """
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        return int(np.datetime64(timestamp, "ns").astype(np.int64))
+    return int(timestamp)
+
+
+class RingBuffer:
+    """Ring buffer with typed columns
+    Timestamps are int64 nanoseconds, readings are float32.
+
+    Each sample is written twice, at i and i + capacity, so the latest
+    n samples are always one contiguous slice. append() is O(1) and
+    last()/window() return views without copying.
+    One writer thread and any number of reader threads may use it,
+    views of old samples are overwritten as new samples arrive.
+
+    param:
+        capacity (int): maximum number of samples
+        fields (list of str): reading column names
+    """
+
+    def __init__(self, capacity, fields):
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive: {capacity}")
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self._time = np.zeros(2 * capacity, dtype=np.int64)
+        self._columns = np.zeros((len(self.fields), 2 * capacity), dtype=np.float32)
+        self._head = 0  # next write position
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, values):
+        """Append one sample
+        param:
+            timestamp (datetime or int): int is nanoseconds since epoch
+            values (sequence of float): in the order of fields
+        """
+        i = self._head
+        j = i + self.capacity
+        self._time[i] = self._time[j] = to_ns(timestamp)
+        self._columns[:, i] = self._columns[:, j] = values
+        # Publish the sample after its data is written.
+        self._head = (i + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _slice(self, n):
+        n = self._count if n is None else min(n, self._count)
+        end = self._head + self.capacity
+        return slice(end - n, end)
+
+    def _views(self, s):
+        data = {"time": self._time[s].view("datetime64[ns]")}
+        for field, column in zip(self.fields, self._columns):
+            data[field] = column[s]
+        return data
+
+    def last(self, n=None):
+        """Return views of the latest n samples (all by default)
+        return: dict of "time" (datetime64[ns]) and field (float32) arrays
+        """
+        return self._views(self._slice(n))
+
+    def window(self, start=None, end=None):
+        """Return views of the samples with start <= time < end
+        param: start, end (datetime or int): None is unbounded
+        """
+        s = self._slice(None)
+        times = self._time[s]
+        first = 0 if start is None else np.searchsorted(times, to_ns(start))
+        last = len(times) if end is None else np.searchsorted(times, to_ns(end))
+        return self._views(slice(s.start + first, s.start + last))
+
+    def to_dataframe(self, n=None):
+        """Return the latest n samples as a pandas.DataFrame indexed by time"""
+        import pandas as pd
+
+        data = self.last(n)
+        return pd.DataFrame({f: data[f] for f in self.fields}, index=data["time"])
@@ -1,38 +1,119 @@
 #!/usr/bin/env python3
 
-from time import sleep
+from time import monotonic, sleep
 from datetime import datetime
-import os
+from acquisition import AcquisitionRunner
+from aggregate import Aggregator
 from bme280 import BME280
-from ccs811 import CCS811
+from ccs811 import CCS811, BASELINE_PATH, MODE_1SEC, MODE_60SEC
+from csv_log import CsvLogWriter
+from log_writer import GroupCommitWriter, FSYNC_NONE
 
 CSV_FILENAME = "./dump_data.csv"
+BINLOG_FILENAME = "./dump_data.bin"
+SQLITE_FILENAME = "./dump_data.sqlite3"
+LOG_DIR = "./dump_data"
+LOG_FORMAT = "csv"  # "csv", "binlog", "partitioned" or "sqlite"
+# Partitions of LOG_DIR, "binlog" or "csv" files of PARTITION_PERIOD each
+PARTITION_FORMAT = "binlog"
+PARTITION_PERIOD = 24 * 60 * 60  # sec
+# Group commit: rows are written together when either threshold is reached.
+# Raise them for high-rate logging to reduce writes to the SD card.
+COMMIT_ROWS = 1
+COMMIT_DELAY = 60 * 60  # sec
+FSYNC = FSYNC_NONE  # FSYNC_NONE, FSYNC_BATCH or FSYNC_INTERVAL
+LOG_INTERVAL = 60 * 10  # sec
+# Sample every SAMPLE_INTERVAL and log one row of the mean, min, max,
+# standard deviation and count of each LOG_INTERVAL (CSV log only).
+# The mean columns keep the names of the plain log.
+AGGREGATE = False
+SAMPLE_INTERVAL = 1  # sec
+FIELDS = ["CO2 ppm", "Celsius", "Humidity %", "Pressure hPa"]
 
-ccs811 = CCS811()
+ccs811 = CCS811(
+    baseline_file=BASELINE_PATH, mode=MODE_1SEC if AGGREGATE else MODE_60SEC
+)
 bme280 = BME280()
-p, t, h = bme280.get()
-ccs811.compensate(h, t)
+# Retries with backoff on bus errors, see runner.stats() for the counts
+runner = AcquisitionRunner()
+runner.add("ccs811", ccs811)
+runner.add("bme280", bme280)
+p, t, h = runner.read("bme280")
+runner.call("ccs811", ccs811.compensate, h, t)
 
-if not os.path.exists(CSV_FILENAME):
-    # write header
-    with open(CSV_FILENAME, "w") as f:
-        f.write("Date, CO2 ppm, Celsius, Humidity %, Pressure hPa\n")
+if AGGREGATE:
+    if LOG_FORMAT != "csv":
+        raise ValueError('AGGREGATE needs LOG_FORMAT = "csv"')
+    log = CsvLogWriter(CSV_FILENAME, header=Aggregator(FIELDS).header())
+elif LOG_FORMAT == "binlog":
+    from binlog import BinLogWriter
 
-with open(CSV_FILENAME, "a") as f:
+    log = BinLogWriter(BINLOG_FILENAME)
+elif LOG_FORMAT == "partitioned":
+    from partitioned_log import PartitionedLogWriter
+
+    log = PartitionedLogWriter(LOG_DIR, fmt=PARTITION_FORMAT, period=PARTITION_PERIOD)
+elif LOG_FORMAT == "sqlite":
+    from sqlite_log import SqliteLogWriter
+
+    log = SqliteLogWriter(SQLITE_FILENAME)
+else:
+    log = CsvLogWriter(CSV_FILENAME)
+log = GroupCommitWriter(log, rows=COMMIT_ROWS, delay=COMMIT_DELAY, fsync=FSYNC)
+
+
+def log_instant(log):
+    """Log one reading every LOG_INTERVAL"""
     while True:
         try:
-            p, t, h = bme280.get()
-            voc, co2 = ccs811.get()
-            ccs811.compensate(h, t)
+            p, t, h = runner.read("bme280")
+            voc, co2 = runner.read("ccs811")
+            runner.call("ccs811", ccs811.compensate, h, t)
             if co2 == 0:
+                # No valid result yet
+                sleep(1)
                 continue
             now = datetime.now()
             # print(f"{now.isoformat()}, {p:7.2f} hPa, {t:6.2f} C, {h:5.2f} %, eCO2:{co2:4d} ppm")
-            f.write(f"{now}, {co2}, {t}, {h}, {p}\n")
-            f.flush()
-            sleep(60 * 10)
-        except OSError:
-            # i2c bus somtimes cannot access
-            continue
+            log.append(now, [co2, t, h, p])
+            sleep(LOG_INTERVAL)
         except KeyboardInterrupt:
             break
+
+
+def log_aggregate(log):
+    """Sample every SAMPLE_INTERVAL, log the statistics every LOG_INTERVAL
+    A channel without samples in the interval (e.g. CCS811 warming up)
+    is left empty.
+    """
+    stats = Aggregator(FIELDS)
+    next_log = monotonic() + LOG_INTERVAL
+    while True:
+        try:
+            p, t, h = runner.read("bme280")
+            stats.add("Celsius", t)
+            stats.add("Humidity %", h)
+            stats.add("Pressure hPa", p)
+            # eCO2 is new only once per CCS811 drive mode interval
+            updated = runner.call("ccs811", ccs811.update)
+            if "eCO2" in updated:
+                stats.add("CO2 ppm", ccs811.eCO2)
+            if updated:
+                runner.call("ccs811", ccs811.compensate, h, t)
+
+            if monotonic() >= next_log and stats.has_data():
+                log.append(datetime.now(), stats.row())
+                stats.reset()
+                while next_log <= monotonic():
+                    next_log += LOG_INTERVAL
+            sleep(SAMPLE_INTERVAL)
+        except KeyboardInterrupt:
+            break
+
+
+with log:
+    if AGGREGATE:
+        log_aggregate(log)
+    else:
+        log_instant(log)
+print(runner.stats())
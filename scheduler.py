@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""Poll several sensors at individual sample periods
+
+usage:
+    scheduler = Scheduler(sinks=[print])
+    scheduler.add(BME280(i2c_address=0x76), period=1)
+    scheduler.add(BME280(i2c_address=0x77), period=1)
+    scheduler.add(CCS811(), period=60)
+    scheduler.run()
+
+Each sensor needs get() and FIELDS. Every read is emitted as a Sample to
+all sinks (callables). Deadlines are absolute (start + offset + n * period),
+so the timing does not drift when a read or a sink is slow.
+"""
+
+import heapq
+from collections import namedtuple
+from datetime import datetime
+from threading import Event
+from time import monotonic
+
+Sample = namedtuple("Sample", ["timestamp", "name", "fields", "values"])
+
+# Offset between the first reads of sensors on the same bus.
+STAGGER = 0.05  # sec
+
+
+class _Entry:
+    """A scheduled sensor and its timing statistics"""
+
+    def __init__(self, sensor, period, name):
+        self.sensor = sensor
+        self.period = period
+        self.name = name
+        self.reads = 0
+        self.errors = 0
+        self.missed = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+
+    def stats(self):
+        return dict(
+            reads=self.reads,
+            errors=self.errors,
+            missed=self.missed,
+            jitter_mean=self.jitter_sum / self.reads if self.reads else 0.0,
+            jitter_max=self.jitter_max,
+        )
+
+
+class Scheduler:
+    """Multi-sensor polling scheduler
+
+    Reads are ordered on a deadline heap. Sensors on the same bus start
+    STAGGER seconds apart, so reads with the same period do not collide.
+    After a read, the next deadlines that have already passed are counted
+    as missed and skipped, instead of reading in a burst to catch up.
+
+    param:
+        sinks (list): callables receiving each Sample
+        stagger (float): offset between sensors on the same bus in seconds
+    """
+
+    def __init__(self, sinks=(), stagger=STAGGER):
+        self.sinks = list(sinks)
+        self.stagger = stagger
+        self._entries = []
+        self._heap = []
+        self._stop = Event()
+
+    def add(self, sensor, period, name=None):
+        """Schedule sensor.get() every period seconds"""
+        if period <= 0:
+            raise ValueError(f"period must be positive: {period}")
+        if name is None:
+            address = f"{sensor.bus_num}:{sensor.i2c_address:#04x}"
+            name = f"{type(sensor).__name__}@{address}"
+        self._entries.append(_Entry(sensor, period, name))
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def stats(self):
+        """Return per-sensor counters: reads, errors, missed, jitter (sec)"""
+        return {entry.name: entry.stats() for entry in self._entries}
+
+    def stop(self):
+        """Stop run(), can be called from another thread or a sink"""
+        self._stop.set()
+
+    def _start(self):
+        start = monotonic()
+        on_bus = {}
+        self._heap = []
+        for seq, entry in enumerate(self._entries):
+            bus = getattr(entry.sensor, "bus_num", None)
+            index = on_bus.get(bus, 0)
+            on_bus[bus] = index + 1
+            heapq.heappush(self._heap, (start + index * self.stagger, seq, entry))
+
+    def run(self, duration=None):
+        """Poll until stop() is called or for duration seconds"""
+        self._stop.clear()
+        self._start()
+        end = None if duration is None else monotonic() + duration
+
+        while self._heap and not self._stop.is_set():
+            deadline, seq, entry = self._heap[0]
+            now = monotonic()
+            if end is not None and min(deadline, now) >= end:
+                break
+            if deadline > now:
+                wait = deadline - now if end is None else min(deadline, end) - now
+                self._stop.wait(wait)
+                continue
+
+            heapq.heappop(self._heap)
+            self._read(entry, now - deadline)
+
+            # Skip deadlines that already passed
+            next_deadline = deadline + entry.period
+            late = monotonic() - next_deadline
+            if late > 0:
+                missed = int(late // entry.period) + 1
+                entry.missed += missed
+                next_deadline += missed * entry.period
+            heapq.heappush(self._heap, (next_deadline, seq, entry))
+
+    def _read(self, entry, jitter):
+        try:
+            values = entry.sensor.get()
+        except OSError:
+            # i2c bus somtimes cannot access
+            entry.errors += 1
+            return
+        entry.reads += 1
+        entry.jitter_sum += jitter
+        entry.jitter_max = max(entry.jitter_max, jitter)
+
+        sample = Sample(datetime.now(), entry.name, entry.sensor.FIELDS, values)
+        for sink in self.sinks:
+            sink(sample)
+
+
+if __name__ == "__main__":
+    from bme280 import BME280
+    from ccs811 import CCS811
+
+    def print_sink(sample):
+        values = zip(sample.fields, sample.values)
+        values = ", ".join(f"{field}: {value:.2f}" for field, value in values)
+        print(f"{sample.timestamp} {sample.name} {values}")
+
+    scheduler = Scheduler(sinks=[print_sink])
+    scheduler.add(BME280(), period=1)
+    scheduler.add(CCS811(), period=1)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        pass
+    print(scheduler.stats())
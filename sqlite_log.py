@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+"""SQLite storage of sensor samples (dump_data.sqlite3)
+
+One table with the time (int64 nanoseconds since epoch, UTC) as the
+primary key, so range queries use its index:
+
+    samples(time INTEGER PRIMARY KEY, co2 REAL, celsius REAL,
+            humidity REAL, pressure REAL)
+
+The database is in WAL mode, readers (the dashboards) do not block the
+logger and see only committed rows.
+
+The writer also keeps rollups of the samples per minute, hour and day,
+updated in the same transaction as the inserted rows:
+
+    rollup_60(bucket INTEGER PRIMARY KEY, count INTEGER, last_time INTEGER,
+              co2_min REAL, co2_max REAL, co2_sum REAL, co2_last REAL,
+              co2_count INTEGER, ...)
+
+bucket is the start time of the period. NaN readings (NULL in SQLite)
+are left out of the aggregates of their field, co2_count counts the
+others. read_summary() answers a wide
+range from the coarsest rollup it needs, with the min/max envelope.
+
+require: pandas for read_range() and read_summary()
+"""
+
+import math
+import sqlite3
+
+from csv_log import timestamp_ns
+
+FIELDS = ("co2", "celsius", "humidity", "pressure")
+TABLE = "samples"
+BUSY_TIMEOUT = 10.0  # sec, waiting for a checkpoint of another connection
+ROLLUPS = (60, 60 * 60, 24 * 60 * 60)  # sec, rollup periods
+MAX_POINTS = 2000  # rows of read_summary()
+_AGGREGATES = ("min", "max", "sum", "last", "count")
+
+
+def _rollup_table(period):
+    return f"rollup_{period}"
+
+
+def _column_definition(column):
+    return f"{column} {'INTEGER' if column.endswith('_count') else 'REAL'}"
+
+
+def _rollup_columns(fields):
+    return [f"{field}_{aggregate}" for field in fields for aggregate in _AGGREGATES]
+
+
+class SqliteLogWriter:
+    """Insert samples into a SQLite database
+    Has the same interface as binlog.BinLogWriter. Appended rows are
+    inserted by flush() in one transaction with one prepared statement,
+    together with the updates of the rollups. A sample written again
+    with the same time replaces the row but is counted twice by them.
+
+    param:
+        path (str): database file, created if missing
+        fields (sequence of str): reading columns after time
+    """
+
+    def __init__(self, path, fields=FIELDS):
+        self.path = path
+        self.fields = tuple(fields)
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # A commit is durable after the next checkpoint, flush(sync=True)
+        # commits with FULL.
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{field} REAL" for field in self.fields)
+        with self.db:
+            self.db.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE} "
+                f"(time INTEGER PRIMARY KEY, {columns})"
+            )
+        placeholders = ", ".join("?" * (len(self.fields) + 1))
+        self._insert = (
+            f"INSERT OR REPLACE INTO {TABLE} "
+            f"(time, {', '.join(self.fields)}) VALUES ({placeholders})"
+        )
+        self._upserts = {}
+        for period in ROLLUPS:
+            self._upserts[period] = self._create_rollup(period)
+        self._rows = []
+
+    def _create_rollup(self, period):
+        """Create the rollup table of period, filled from existing samples
+        return: UPSERT statement of one sample into it
+        """
+        table = _rollup_table(period)
+        columns = _rollup_columns(self.fields)
+        updates = [
+            "count = count + 1",
+            "last_time = max(last_time, excluded.last_time)",
+        ]
+        for f in self.fields:
+            # min() and max() of SQL return NULL if an argument is NULL
+            updates += [
+                f"{f}_min = coalesce(min({f}_min, excluded.{f}_min), "
+                f"{f}_min, excluded.{f}_min)",
+                f"{f}_max = coalesce(max({f}_max, excluded.{f}_max), "
+                f"{f}_max, excluded.{f}_max)",
+                f"{f}_sum = coalesce({f}_sum, 0) + coalesce(excluded.{f}_sum, 0)",
+                f"{f}_last = CASE WHEN excluded.{f}_last IS NOT NULL "
+                f"AND excluded.last_time >= last_time "
+                f"THEN excluded.{f}_last ELSE {f}_last END",
+                f"{f}_count = {f}_count + excluded.{f}_count",
+            ]
+        # The right-hand sides of SET see the old row
+        upsert = (
+            f"INSERT INTO {table} (bucket, count, last_time, {', '.join(columns)}) "
+            f"VALUES (?, 1, {', '.join('?' * (len(columns) + 1))}) "
+            f"ON CONFLICT(bucket) DO UPDATE SET {', '.join(updates)}"
+        )
+
+        exists = self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (table,),
+        ).fetchone()
+        if exists:
+            return upsert
+        with self.db:
+            self.db.execute(
+                f"CREATE TABLE {table} (bucket INTEGER PRIMARY KEY, "
+                f"count INTEGER, last_time INTEGER, "
+                f"{', '.join(_column_definition(c) for c in columns)})"
+            )
+            rows = self.db.execute(
+                f"SELECT time, {', '.join(self.fields)} FROM {TABLE}"
+            ).fetchall()
+            self.db.executemany(upsert, self._rollup_rows(period, rows))
+        return upsert
+
+    def _rollup_rows(self, period, rows):
+        """Return the UPSERT parameters of sample rows"""
+        period_ns = period * 10**9
+        params = []
+        for time, *values in rows:
+            row = [time // period_ns * period_ns, time]
+            for value in values:
+                if value is None or math.isnan(value):
+                    row += [None, None, None, None, 0]
+                else:
+                    row += [value, value, value, value, 1]
+            params.append(row)
+        return params
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, timestamp, values):
+        """Append one sample
+        param:
+            timestamp (datetime or int): int is nanoseconds since epoch
+            values (sequence of float): in the order of fields
+        """
+        self._rows.append((timestamp_ns(timestamp), *values))
+
+    def flush(self, sync=False):
+        """Insert the appended rows
+        param: sync (bool): make them durable before returning
+        """
+        if not self._rows:
+            return
+        if sync:
+            self.db.execute("PRAGMA synchronous=FULL")
+        with self.db:
+            self.db.executemany(self._insert, self._rows)
+            for period, upsert in self._upserts.items():
+                self.db.executemany(upsert, self._rollup_rows(period, self._rows))
+        if sync:
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+def connect_readonly(path):
+    """Open a database for reading, it is not created if missing"""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+
+
+def last_time(path):
+    """Return the time (ns) of the last sample, None if there is none"""
+    db = connect_readonly(path)
+    try:
+        (time,) = db.execute(f"SELECT MAX(time) FROM {TABLE}").fetchone()
+    finally:
+        db.close()
+    return time
+
+
+def _range_params(start, end):
+    start = -(2**63) if start is None else timestamp_ns(start)
+    end = 2**63 - 1 if end is None else timestamp_ns(end)
+    return start, end
+
+
+def read_range(path, start=None, end=None, fields=FIELDS):
+    """Read samples with start <= time < end into a pandas.DataFrame
+    param:
+        start, end (datetime or int): None is unbounded
+        fields (sequence of str): wanted columns
+    return: columns named as in dump_data.csv, indexed by UTC "Date"
+    """
+    import pandas as pd
+    from binlog import CSV_COLUMNS
+
+    query = (
+        f"SELECT time, {', '.join(fields)} FROM {TABLE} "
+        "WHERE time >= ? AND time < ? ORDER BY time"
+    )
+    db = connect_readonly(path)
+    try:
+        df = pd.read_sql_query(query, db, params=_range_params(start, end))
+    finally:
+        db.close()
+    df.index = pd.to_datetime(df.pop("time"), utc=True)
+    df.index.name = "Date"
+    return df.rename(columns=CSV_COLUMNS)
+
+
+def read_summary(path, start=None, end=None, max_points=MAX_POINTS, fields=FIELDS):
+    """Read start <= time < end in at most about max_points rows
+    The samples are returned if there are not more than max_points of
+    them, else the rollup of the shortest period that fits, with the
+    mean in the columns of the samples and the envelope in "... min" and
+    "... max" columns (e.g. "CO2 ppm min").
+
+    param:
+        start, end (datetime or int): None is the whole log
+    return: (pandas.DataFrame) indexed by UTC "Date", the bucket start
+        of a rollup
+    """
+    import pandas as pd
+    from binlog import CSV_COLUMNS
+
+    db = connect_readonly(path)
+    try:
+        first, last, count = db.execute(
+            f"SELECT MIN(time), MAX(time), COUNT(*) FROM {TABLE} "
+            "WHERE time >= ? AND time < ?",
+            _range_params(start, end),
+        ).fetchone()
+    finally:
+        db.close()
+    if count <= max_points:
+        return read_range(path, start, end, fields)
+
+    span = (last - first) / 10**9
+    periods = [p for p in ROLLUPS if span / p <= max_points]
+    period = periods[0] if periods else ROLLUPS[-1]
+    period_ns = period * 10**9
+    # Whole buckets containing the range
+    start = first // period_ns * period_ns
+    columns = ["count"]
+    for field in fields:
+        columns += [
+            f"{field}_sum / {field}_count",
+            f"{field}_min",
+            f"{field}_max",
+        ]
+    query = (
+        f"SELECT bucket, {', '.join(columns)} FROM {_rollup_table(period)} "
+        "WHERE bucket >= ? AND bucket <= ? ORDER BY bucket"
+    )
+    db = connect_readonly(path)
+    try:
+        rows = db.execute(query, (start, last)).fetchall()
+    finally:
+        db.close()
+
+    names = ["count"]
+    for field in fields:
+        name = CSV_COLUMNS.get(field, field)
+        names += [name, f"{name} min", f"{name} max"]
+    df = pd.DataFrame([row[1:] for row in rows], columns=names)
+    df.index = pd.to_datetime([row[0] for row in rows], utc=True)
+    df.index.name = "Date"
+    return df
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+"""Tests of the retries of AcquisitionRunner
+
+usage: python3 -m pytest test_acquisition.py
+"""
+
+import errno
+
+import pytest
+
+from acquisition import AcquisitionRunner
+
+
+class FlakySensor:
+    """Raises the given errors from get(), then returns a value"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.reinits = 0
+
+    def get(self):
+        if self.errors:
+            raise self.errors.pop(0)
+        return 1.0
+
+    def reinit(self):
+        self.reinits += 1
+
+
+def _runner(sensor):
+    runner = AcquisitionRunner(backoff_min=0, backoff_max=0, reinit_failures=2)
+    runner.add("sensor", sensor)
+    return runner
+
+
+def test_bus_errors_are_retried():
+    eio = OSError(errno.EIO, "Input/output error")
+    sensor = FlakySensor(eio, eio, TimeoutError("no result"))
+    runner = _runner(sensor)
+    assert runner.read("sensor") == 1.0
+    assert runner.stats("sensor")["errors"] == 3
+    assert sensor.reinits == 1
+
+
+def test_file_errors_are_raised():
+    sensor = FlakySensor(OSError(errno.ENOSPC, "No space left on device"))
+    runner = _runner(sensor)
+    with pytest.raises(OSError):
+        runner.read("sensor")
+    assert runner.stats("sensor")["errors"] == 0
+    assert sensor.reinits == 0
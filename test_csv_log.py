@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+"""Tests of the CSV log index
+
+usage: python3 -m pytest test_csv_log.py
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import csv_log
+from csv_log import CsvLogWriter, CsvTailReader, load_csv_index
+
+START = datetime(2024, 1, 1)
+
+
+def _write(path, count, start=START):
+    with CsvLogWriter(path) as log:
+        for i in range(count):
+            log.append(start + timedelta(seconds=i), [400 + i, 20.0, 40.0, 1000.0])
+
+
+def test_stale_index_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(csv_log, "INDEX_INTERVAL", 256)
+    path = str(tmp_path / "dump_data.csv")
+    _write(path, 100)
+    stale = open(path + csv_log.INDEX_SUFFIX, "rb").read()
+    # Rotated: a new log of other rows next to the old index
+    os.remove(path)
+    _write(path, 0)
+    _write(path, 50, START + timedelta(days=1))
+    open(path + csv_log.INDEX_SUFFIX, "wb").write(stale)
+
+    reader = CsvTailReader(path, START + timedelta(days=1, seconds=40))
+    df, reset = reader.read()
+    assert reset
+    assert df["CO2 ppm"].iloc[-1] == 449
+    assert df["CO2 ppm"].iloc[0] <= 440
+
+    _write(path, 1, START + timedelta(days=2))
+    times, offsets = load_csv_index(path)
+    assert times[0] == csv_log.timestamp_ns(START + timedelta(days=1))
+    with open(path, "rb") as f:
+        for offset in offsets:
+            f.seek(offset - 1)
+            assert f.read(1) == b"\n"
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""Tests of the SQLite log rollups
+
+usage: python3 -m pytest test_sqlite_log.py
+"""
+
+import math
+import sqlite3
+from datetime import datetime, timedelta
+
+from sqlite_log import SqliteLogWriter, read_summary
+
+START = datetime(2024, 1, 1)
+
+
+def _write(path, rows):
+    with SqliteLogWriter(path) as log:
+        for i, values in enumerate(rows):
+            log.append(START + timedelta(seconds=10 * i), values)
+
+
+def _rollup(path, period):
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    try:
+        return db.execute(f"SELECT * FROM rollup_{period}").fetchall()
+    finally:
+        db.close()
+
+
+def test_rollup_skips_nan(tmp_path):
+    path = str(tmp_path / "log.sqlite3")
+    nan = float("nan")
+    _write(
+        path,
+        [
+            [400, 20.0, 40.0, 1000.0],
+            [500, 21.0, 41.0, nan],
+            [600, 22.0, 42.0, 1002.0],
+            [nan, 23.0, 43.0, 1004.0],
+        ],
+    )
+    (bucket,) = _rollup(path, 60)
+    assert bucket["count"] == 4
+    assert bucket["pressure_min"] == 1000.0
+    assert bucket["pressure_max"] == 1004.0
+    assert bucket["pressure_count"] == 3
+    assert bucket["pressure_sum"] / bucket["pressure_count"] == 1002.0
+    assert bucket["pressure_last"] == 1004.0
+    assert bucket["co2_max"] == 600
+    assert bucket["co2_last"] == 600
+
+
+def test_rollup_of_nan_only(tmp_path):
+    path = str(tmp_path / "log.sqlite3")
+    nan = float("nan")
+    _write(path, [[nan, 20.0, 40.0, 1000.0], [nan, 21.0, 41.0, 1001.0]])
+    (bucket,) = _rollup(path, 60)
+    assert bucket["co2_min"] is None
+    assert bucket["co2_count"] == 0
+    assert bucket["celsius_max"] == 21.0
+
+
+def test_summary_mean_skips_nan(tmp_path):
+    path = str(tmp_path / "log.sqlite3")
+    rows = [[400, 20.0, 40.0, 1000.0]] * 400
+    rows[5] = [400, 20.0, 40.0, float("nan")]
+    _write(path, rows)
+    df = read_summary(path, max_points=10)
+    assert len(df) <= 10
+    assert not df["Pressure hPa"].isna().any()
+    assert (df["Pressure hPa min"] == 1000.0).all()
+    assert not math.isnan(df["CO2 ppm max"].iloc[0])